@@ -0,0 +1,4 @@
+from anno1800skyscraper.cli import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Optional
+
+from anno1800skyscraper.strategies import Strategy
+
+
+class AdaptiveController:
+    """
+    Adapts the n_change of a strategy with the 1/5th success rule and detects
+    plateaus. An epoch is a success if it increases the current total. Every
+    window epochs, n_change grows by factor if more than target of the last
+    window epochs were successes and shrinks by factor if fewer were. The run
+    has converged once the best total has not improved for patience epochs.
+    acceptance_rate is the share of the last window epochs in which the
+    strategy kept its move, including moves that leave the total unchanged.
+    """
+
+    def __init__(
+        self,
+        window: int = 200,
+        target: float = 0.2,
+        factor: float = 1.5,
+        patience: Optional[int] = None,
+        adapt: bool = True,
+        max_change: Optional[int] = None,
+    ):
+        if window < 1:
+            raise ValueError("The window needs at least one epoch")
+        if factor <= 1:
+            raise ValueError("The adaption factor has to be greater than 1")
+        self.window = window
+        self.target = target
+        self.factor = factor
+        self.patience = patience
+        self.adapt = adapt
+        self.max_change = max_change
+
+    def start(self, strategy: Strategy) -> None:
+        self.strategy = strategy
+        self.change = float(strategy.n_change)
+        self.max = strategy.layout.n if self.max_change is None else self.max_change
+        self.successes: Deque[bool] = deque(maxlen=self.window)
+        self.accepts: Deque[bool] = deque(maxlen=self.window)
+        self.previous = strategy.total
+        self.best_total = strategy.best_total
+        self.stale = 0
+        self.epoch = 0
+
+    @property
+    def success_rate(self) -> float:
+        return sum(self.successes) / max(len(self.successes), 1)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return sum(self.accepts) / max(len(self.accepts), 1)
+
+    def update(self) -> bool:
+        """
+        Records the last epoch of the strategy and adapts its n_change.
+        :return: Whether the run has converged
+        """
+        strategy = self.strategy
+        self.epoch += 1
+        self.successes.append(strategy.total > self.previous)
+        self.accepts.append(strategy.accepted)
+        self.previous = strategy.total
+        if strategy.best_total > self.best_total:
+            self.best_total = strategy.best_total
+            self.stale = 0
+        else:
+            self.stale += 1
+        if self.adapt and self.epoch % self.window == 0:
+            if self.success_rate > self.target:
+                self.change = min(self.change * self.factor, self.max)
+            elif self.success_rate < self.target:
+                self.change = max(self.change / self.factor, 1)
+            strategy.n_change = max(1, round(self.change))
+        return self.patience is not None and self.stale >= self.patience
@@ -0,0 +1,181 @@
+"""
+Optimization of every layout below a root directory in one run. The layouts
+are distributed over a pool of worker processes, largest first, so that a
+large layout does not start last and keep a single worker busy at the end.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from pathlib import Path, PosixPath
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+from tqdm import tqdm
+
+from anno1800skyscraper.adaptive import AdaptiveController
+from anno1800skyscraper.const import SKYSCRAPER_IDENTIFIERS
+from anno1800skyscraper.map import Map
+from anno1800skyscraper.progression import MAX_POINTS, Progression
+from anno1800skyscraper.strategies import make_strategy, n_change
+
+SUMMARY_COLUMNS = ["layout", "houses", "start", "end", "seconds", "epochs_per_s"]
+
+
+def count_houses(filename: Union[str, Path, PosixPath]) -> int:
+    """Number of skyscrapers in an Anno Designer file, without building a Map."""
+    with open(filename) as f:
+        objects = json.load(f)["Objects"]
+    return sum(obj["Identifier"] in SKYSCRAPER_IDENTIFIERS for obj in objects)
+
+
+def find_layouts(root: Union[str, Path, PosixPath]) -> List[Path]:
+    """
+    Every layout below root, that is every .ad file that is not the output of
+    an optimization, ordered by the number of houses, largest first.
+    """
+    layouts = [
+        filename
+        for filename in sorted(Path(root).rglob("*.ad"))
+        if not filename.stem.endswith("_out")
+    ]
+    houses = {filename: count_houses(filename) for filename in layouts}
+    return sorted(layouts, key=lambda filename: -houses[filename])
+
+
+def optimize_layout(
+    filename: Path,
+    epochs: int,
+    change: Union[int, float],
+    seed: np.random.SeedSequence,
+    strategy: str = "greedy",
+    gap_tolerance: Optional[float] = None,
+    adaptive: bool = False,
+    patience: Optional[int] = None,
+    **strategy_options: Any,
+) -> Dict[str, Any]:
+    """
+    Optimizes one layout and saves it next to it as <name>_out.ad. Like a
+    single run, it continues from the output of an earlier run if there is
+    one, and stops early once it is within gap_tolerance of the upper bound.
+    With adaptive or patience, the run is controlled by an AdaptiveController.
+    :return: One row of the summary
+    """
+    out_file = filename.parent / (filename.stem + "_out.ad")
+    house_map = Map.load_from_ad(out_file if out_file.exists() else filename)
+    houses = len(house_map.houses)
+    changed = n_change(change, houses)
+    start = house_map.total_inhabitants
+    started = time.perf_counter()
+    progression = Progression(max_points=MAX_POINTS)
+    house_map, _ = Map.optimize(
+        house_map,
+        epochs,
+        changed,
+        rng=np.random.default_rng(seed),
+        strategy=make_strategy(strategy, changed, **strategy_options),
+        gap_tolerance=gap_tolerance,
+        controller=(
+            AdaptiveController(patience=patience, adapt=adaptive)
+            if adaptive or patience is not None
+            else None
+        ),
+        progress=False,
+        progression=progression,
+    )
+    seconds = time.perf_counter() - started
+    house_map.save_to_ad(out_file)
+    return {
+        "layout": str(filename),
+        "houses": houses,
+        "start": start,
+        "end": house_map.total_inhabitants,
+        "seconds": seconds,
+        "epochs_per_s": progression.epoch / seconds if seconds > 0 else 0.0,
+    }
+
+
+def optimize_all(
+    root: Union[str, Path, PosixPath],
+    epochs: int,
+    change: Union[int, float],
+    workers: int = 1,
+    seed: Optional[int] = None,
+    strategy: str = "greedy",
+    gap_tolerance: Optional[float] = None,
+    adaptive: bool = False,
+    patience: Optional[int] = None,
+    **strategy_options: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Optimizes every layout found by find_layouts, in workers processes if
+    workers > 1. Every layout gets its own RNG stream spawned from seed and
+    its own strategy made by make_strategy with strategy_options, and stops
+    early once it is within gap_tolerance of its upper bound. adaptive and
+    patience are passed on to optimize_layout.
+    :return: The summary rows, in the order of find_layouts
+    """
+    layouts = find_layouts(root)
+    if not layouts:
+        raise ValueError(f"No layouts found in {root}")
+    seeds = np.random.SeedSequence(seed).spawn(len(layouts))
+    jobs = [
+        (
+            filename,
+            epochs,
+            change,
+            layout_seed,
+            strategy,
+            gap_tolerance,
+            adaptive,
+            patience,
+        )
+        for filename, layout_seed in zip(layouts, seeds)
+    ]
+    progress = tqdm(total=len(layouts), unit="layout")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures: Dict[Future[Dict[str, Any]], Path] = {
+                executor.submit(optimize_layout, *job, **strategy_options): job[0]
+                for job in jobs
+            }
+            rows = {}
+            for future in as_completed(futures):
+                rows[futures[future]] = future.result()
+                progress.update()
+        results = [rows[filename] for filename in layouts]
+    else:
+        results = []
+        for job in jobs:
+            results.append(optimize_layout(*job, **strategy_options))
+            progress.update()
+    progress.close()
+    return results
+
+
+def format_summary(rows: List[Dict[str, Any]]) -> str:
+    """The summary rows of optimize_all as a table."""
+    width = max(len("layout"), *(len(row["layout"]) for row in rows))
+    lines = [
+        f"{'layout':<{width}} {'houses':>7} {'start':>9} {'end':>9} "
+        f"{'gain':>8} {'seconds':>9} {'epochs/s':>9}"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['layout']:<{width}} {row['houses']:>7} {row['start']:>9} "
+            f"{row['end']:>9} {row['end'] - row['start']:>8} "
+            f"{row['seconds']:9.2f} {row['epochs_per_s']:9.0f}"
+        )
+    return "\n".join(lines)
+
+
+def save_summary(
+    rows: List[Dict[str, Any]], filename: Union[str, Path, PosixPath]
+) -> None:
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
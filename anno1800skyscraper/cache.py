@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from anno1800skyscraper.engine import IntArray, N_LEVELS
+
+# Approximate memory of one OrderedDict entry with an int key and an int value
+ENTRY_BYTES = 176
+
+
+class ZobristHash:
+    """
+    Hashes a level vector as the xor of one random 64 bit key per house and
+    level. A move of a few houses updates a hash by xoring out the keys of
+    their old levels and xoring in the keys of the new ones.
+    """
+
+    def __init__(self, n: int, seed: int = 0):
+        self.keys = np.random.default_rng(seed).integers(
+            0, 2**64, (n, N_LEVELS), dtype=np.uint64, endpoint=False
+        )
+        self._keys: List[List[int]] = self.keys.tolist()
+
+    def hash(self, levels: IntArray) -> int:
+        return int(np.bitwise_xor.reduce(self.keys[np.arange(len(self.keys)), levels]))
+
+    def batch_hash(self, levels: IntArray) -> IntArray:
+        """Hashes of each row of a (k, n) batch of level vectors."""
+        return np.bitwise_xor.reduce(
+            self.keys[np.arange(len(self.keys)), levels], axis=-1
+        )
+
+    def update(
+        self, key: int, idx: Iterable[int], old: Iterable[int], new: Iterable[int]
+    ) -> int:
+        for i, before, after in zip(idx, old, new):
+            key ^= self._keys[i][before] ^ self._keys[i][after]
+        return key
+
+
+class StateCache:
+    """
+    Totals of level vectors keyed by their hash, holding at most max_mb
+    megabytes. The least recently used entry is evicted first.
+    """
+
+    def __init__(self, max_mb: float = 64):
+        self.max_entries = max(1, int(max_mb * 2**20 / ENTRY_BYTES))
+        self.entries: OrderedDict[int, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: int) -> Optional[int]:
+        total = self.entries.get(key)
+        if total is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return total
+
+    def put(self, key: int, total: int) -> None:
+        self.entries[key] = total
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def report(self) -> str:
+        return (
+            f"Cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate:.1%} hit rate), {len(self)} states"
+        )
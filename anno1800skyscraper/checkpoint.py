@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path, PosixPath
+from typing import Any, Dict, Union
+
+import numpy as np
+
+from anno1800skyscraper.engine import IntArray
+from anno1800skyscraper.progression import Progression
+from anno1800skyscraper.strategies import Strategy, make_strategy
+
+STATE_PREFIX = "state_"
+PROGRESSION_PREFIX = "progression_"
+PROGRESSION_ARRAYS = ["epochs", "totals", "improved"]
+
+
+class Checkpoint:
+    """
+    Snapshot of a running Map.optimize: the current and best levels, the
+    state of the Progression of the run, the state of the RNG and the name,
+    parameters and state arrays of the strategy. Stored as one compressed
+    npz file.
+    """
+
+    def __init__(
+        self,
+        levels: IntArray,
+        best_levels: IntArray,
+        progression: Dict[str, Any],
+        epoch: int,
+        rng_state: Dict[str, Any],
+        strategy_name: str,
+        strategy_params: Dict[str, Any],
+        strategy_state: Dict[str, IntArray],
+    ):
+        self.levels = levels
+        self.best_levels = best_levels
+        self.progression = progression
+        self.epoch = epoch
+        self.rng_state = rng_state
+        self.strategy_name = strategy_name
+        self.strategy_params = strategy_params
+        self.strategy_state = strategy_state
+
+    @staticmethod
+    def from_run(
+        strategy: Strategy, rng: np.random.Generator, progression: Progression
+    ) -> Checkpoint:
+        return Checkpoint(
+            levels=strategy.layout.levels.copy(),
+            best_levels=strategy.best_levels.copy(),
+            progression=progression.state(),
+            epoch=strategy.epoch,
+            rng_state=dict(rng.bit_generator.state),
+            strategy_name=strategy.name,
+            strategy_params=strategy.params(),
+            strategy_state=strategy.state(),
+        )
+
+    def make_strategy(self) -> Strategy:
+        params = dict(self.strategy_params)
+        return make_strategy(self.strategy_name, params.pop("n_change"), **params)
+
+    def restore(self, strategy: Strategy, rng: np.random.Generator) -> None:
+        """
+        Continues a started strategy and an RNG where the checkpoint left
+        off. The layout of the strategy has to be at the levels of the
+        checkpoint already.
+        """
+        strategy.restore(self.strategy_state)
+        strategy.epoch = self.epoch
+        strategy.best_levels = self.best_levels.copy()
+        strategy.best_total = strategy.layout.total_inhabitants(self.best_levels)
+        rng.bit_generator.state = self.rng_state
+
+    def save(self, filename: Union[str, Path, PosixPath]) -> None:
+        """
+        Writes the checkpoint to a temporary file next to filename and moves
+        it into place, so an interrupted write never leaves a broken file.
+        """
+        path = Path(filename)
+        meta = {
+            "epoch": self.epoch,
+            "rng": self.rng_state,
+            "strategy": self.strategy_name,
+            "params": self.strategy_params,
+            "progression": {
+                name: value
+                for name, value in self.progression.items()
+                if name not in PROGRESSION_ARRAYS
+            },
+        }
+        arrays: Dict[str, Any] = {
+            STATE_PREFIX + name: array for name, array in self.strategy_state.items()
+        }
+        for name in PROGRESSION_ARRAYS:
+            arrays[PROGRESSION_PREFIX + name] = self.progression[name]
+        arrays.update(
+            levels=self.levels,
+            best_levels=self.best_levels,
+            meta=np.array(json.dumps(meta)),
+        )
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def load(filename: Union[str, Path, PosixPath]) -> Checkpoint:
+        with np.load(filename) as data:
+            meta = json.loads(str(data["meta"]))
+            return Checkpoint(
+                levels=data["levels"],
+                best_levels=data["best_levels"],
+                progression=dict(
+                    meta["progression"],
+                    **{
+                        name: data[PROGRESSION_PREFIX + name]
+                        for name in PROGRESSION_ARRAYS
+                    },
+                ),
+                epoch=meta["epoch"],
+                rng_state=meta["rng"],
+                strategy_name=meta["strategy"],
+                strategy_params=meta["params"],
+                strategy_state={
+                    name[len(STATE_PREFIX) :]: data[name]
+                    for name in data.files
+                    if name.startswith(STATE_PREFIX)
+                },
+            )
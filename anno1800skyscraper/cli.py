@@ -0,0 +1,286 @@
+"""
+Command line interface, run with python main.py or python -m anno1800skyscraper.
+Modules that are only needed by some options are imported when the option is
+used, so short headless runs start quickly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+from anno1800skyscraper import profiling
+from anno1800skyscraper.adaptive import AdaptiveController
+from anno1800skyscraper.exact import optimality_gap
+from anno1800skyscraper.map import Map
+from anno1800skyscraper.progression import MAX_POINTS, Progression
+from anno1800skyscraper.strategies import (
+    STRATEGIES,
+    SCHEDULES,
+    make_strategy,
+    n_change,
+)
+
+# Larger layouts are drawn without labels unless --labels is given
+MAX_LABELED_HOUSES = 1000
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="Anno1800SkyscraperOptimizer",
+        description="This tool finds the (near) optimal distribution of houses for "
+        "any given skyscraper layout",
+    )
+    parser.add_argument("-d", "--dir", default="./layouts/realistic")
+    parser.add_argument("-r", "--root", default=None)
+    parser.add_argument("-e", "--epochs", default=10000, type=int)
+    parser.add_argument("-c", "--change", default=".05")
+    parser.add_argument("-b", "--batch", default=1, type=int)
+    parser.add_argument("-w", "--workers", default=1, type=int)
+    parser.add_argument("-s", "--seed", default=None, type=int)
+    parser.add_argument("--strategy", default="greedy", choices=list(STRATEGIES))
+    parser.add_argument("--t-start", default=None, type=float)
+    parser.add_argument("--t-end", default=None, type=float)
+    parser.add_argument("--schedule", default=None, choices=list(SCHEDULES))
+    parser.add_argument("--replicas", default=None, type=int)
+    parser.add_argument("--population", default=None, type=int)
+    parser.add_argument("--cache", default=None, type=float)
+    parser.add_argument("--gap", default=None, type=float)
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--patience", default=None, type=int)
+    parser.add_argument("--checkpoint", action="store_true")
+    parser.add_argument("--checkpoint-every", default=300, type=float)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--no-plots", action="store_true")
+    parser.add_argument("--background-plots", action="store_true")
+    parser.add_argument("--labels", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--dpi", default=600, type=float)
+    parser.add_argument("--format", nargs="+", default=["png"])
+    parser.add_argument("--profile", nargs="?", const="", default=None)
+    parser.add_argument("--profile-memory", action="store_true")
+    parser.add_argument("--components", action="store_true")
+    parser.add_argument("--exact", action="store_true")
+    parser.add_argument("--time-limit", default=60, type=float)
+    parser.add_argument("--polish", default=0, type=int)
+    parser.add_argument("--window", default=8, type=int)
+    parser.add_argument("--record-every", default=1, type=int)
+    parser.add_argument("--max-points", default=MAX_POINTS, type=int)
+    parser.add_argument("--progression", default=None)
+    return parser
+
+
+def run_batch(args: argparse.Namespace, change: Union[int, float]) -> None:
+    """Optimizes every layout below args.root and writes the summary there."""
+    from anno1800skyscraper.batch import format_summary, optimize_all, save_summary
+
+    rows = optimize_all(
+        args.root,
+        args.epochs,
+        change,
+        workers=args.workers,
+        seed=args.seed,
+        strategy=args.strategy,
+        gap_tolerance=args.gap,
+        adaptive=args.adaptive,
+        patience=args.patience,
+        batch_size=args.batch,
+        t_start=args.t_start,
+        t_end=args.t_end,
+        schedule=args.schedule,
+        replicas=args.replicas,
+        population=args.population,
+        cache_mb=args.cache,
+    )
+    print(format_summary(rows))
+    summary = Path(args.root) / "summary.csv"
+    save_summary(rows, summary)
+    print(f"Summary written to {summary}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    sys.setrecursionlimit(10000)
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.gap is not None and (args.exact or args.components):
+        parser.error("--gap is not supported with --exact or --components")
+    if (args.adaptive or args.patience is not None) and (
+        args.exact or args.components or args.workers > 1 and args.root is None
+    ):
+        parser.error(
+            "--adaptive and --patience are not supported with --exact, "
+            "--components or more than one worker"
+        )
+
+    change = args.change
+    change = int(change) if change.isdigit() else float(change)
+    folder = Path(args.dir)
+    epochs = args.epochs
+    if args.root is not None:
+        run_batch(args, change)
+        return
+
+    try:
+        in_file = next(
+            f for f in sorted(folder.glob("*.ad")) if not f.stem.endswith("_out")
+        )
+    except StopIteration:
+        raise ValueError(f"Input File in {folder} not found")
+    out_file = folder / (in_file.stem + "_out.ad")
+    checkpoint = folder / (in_file.stem + "_checkpoint.npz")
+    if args.profile is not None:
+        profiling.enable(trace_memory=args.profile_memory)
+
+    map = Map.load_from_ad(in_file)
+
+    changed = n_change(change, len(map.houses))
+    labels = (
+        len(map.houses) <= MAX_LABELED_HOUSES if args.labels is None else args.labels
+    )
+
+    renders: List[Optional[BaseProcess]] = []
+    background = args.background_plots
+    if not args.no_plots and not background:
+        from anno1800skyscraper.render import interactive
+
+        # Figures that cannot be shown anyway are saved in the background
+        background = not interactive()
+    if not args.no_plots:
+        renders.append(
+            map.print_housemap(
+                tight_layout=True,
+                print_labels=labels,
+                filename=folder / in_file.name.split(".")[0],
+                dpi=args.dpi,
+                formats=args.format,
+                background=background,
+            )
+        )
+
+    if out_file.exists():
+        map = Map.load_from_ad(out_file)
+
+    strategy = make_strategy(
+        args.strategy,
+        changed,
+        batch_size=args.batch,
+        t_start=args.t_start,
+        t_end=args.t_end,
+        schedule=args.schedule,
+        replicas=args.replicas,
+        population=args.population,
+        cache_mb=args.cache,
+    )
+    resume = None
+    if args.resume:
+        if not checkpoint.exists():
+            raise ValueError(f"Checkpoint {checkpoint} not found")
+        from anno1800skyscraper.checkpoint import Checkpoint
+
+        resume = Checkpoint.load(checkpoint)
+        strategy = resume.make_strategy()
+    controller = (
+        AdaptiveController(patience=args.patience, adapt=args.adaptive)
+        if args.adaptive or args.patience is not None
+        else None
+    )
+    progression = Progression(args.record_every, args.max_points, args.progression)
+    if args.exact:
+        from anno1800skyscraper.exact import optimize_exact
+
+        progression.record(0, map.total_inhabitants)
+        map, optimal = optimize_exact(map, time_limit=args.time_limit)
+        progression.record(1, map.total_inhabitants)
+        print(
+            "Found optimal solution"
+            if optimal
+            else "Time limit reached, keeping best solution found"
+        )
+    elif args.components:
+        from anno1800skyscraper.components import optimize_components
+
+        map, _ = optimize_components(
+            map,
+            epochs,
+            changed,
+            workers=args.workers,
+            seed=args.seed,
+            strategy=strategy,
+            progression=progression,
+        )
+    elif args.workers > 1:
+        from anno1800skyscraper.parallel import optimize_parallel
+
+        map, _ = optimize_parallel(
+            map,
+            epochs,
+            changed,
+            workers=args.workers,
+            seed=args.seed,
+            strategy=strategy,
+            progression=progression,
+            gap_tolerance=args.gap,
+        )
+    else:
+        map, _ = map.optimize(
+            map,
+            epochs,
+            changed,
+            rng=np.random.default_rng(args.seed),
+            strategy=strategy,
+            gap_tolerance=args.gap,
+            controller=controller,
+            checkpoint=checkpoint if args.checkpoint or args.resume else None,
+            checkpoint_every=args.checkpoint_every,
+            resume=resume,
+            progression=progression,
+        )
+        if strategy.cache is not None:
+            print(strategy.cache.report())
+    if args.polish > 0:
+        from anno1800skyscraper.lns import polish
+
+        map, polished = polish(
+            map,
+            args.polish,
+            max_size=args.window,
+            rng=np.random.default_rng(args.seed),
+        )
+        for total in polished[1:]:
+            progression.record(progression.epoch + 1, total)
+    bound = map.upper_bound
+    print(
+        f"Total {map.total_inhabitants}, upper bound {bound}, "
+        f"gap {optimality_gap(map.total_inhabitants, bound):.2%}"
+    )
+    map.save_to_ad(out_file)
+
+    if not args.no_plots:
+        from utils.figures import print_progression
+
+        renders.append(
+            map.print_housemap(
+                tight_layout=True,
+                print_labels=labels,
+                filename=folder / out_file.name.split(".")[0],
+                dpi=args.dpi,
+                formats=args.format,
+                background=background,
+            )
+        )
+        with profiling.PROFILER.phase("render"):
+            print_progression(
+                progression.totals, epochs=progression.epochs, tight_layout=True
+            )
+    progression.close()
+    if args.profile is not None:
+        profile = Path(args.profile or folder / (in_file.stem + "_profile.json"))
+        profiling.disable().save(profile)
+        print(f"Profile written to {profile}")
+    for render in renders:
+        if render is not None:
+            render.join()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from anno1800skyscraper.engine import Layout, IntArray
+from anno1800skyscraper.progression import MAX_POINTS, Progression
+from anno1800skyscraper.strategies import Strategy, Greedy
+from anno1800skyscraper.symmetry import Symmetry
+
+if TYPE_CHECKING:
+    from anno1800skyscraper.map import Map
+
+MAX_EXACT_STATES = 2**20
+
+
+def n_states(layout: Layout) -> int:
+    return int(np.prod(layout.max_levels.astype(object)))
+
+
+def solve_exact(
+    layout: Layout, chunk_size: int = 4096, symmetry: Optional[Symmetry] = None
+) -> Tuple[int, IntArray]:
+    """
+    Scores every level assignment of the layout in chunks of chunk_size. With
+    a symmetry, only assignments in canonical form are scored.
+    :return: Best total and levels
+    """
+    max_levels = layout.max_levels.astype(np.int64)
+    radix = np.concatenate([[1], np.cumprod(max_levels)[:-1]])
+    best_total, best_levels = layout.total, layout.levels.copy()
+    for start in range(0, n_states(layout), chunk_size):
+        states = np.arange(start, min(start + chunk_size, n_states(layout)))
+        levels = (states[:, None] // radix % max_levels + 1).astype(np.uint8)
+        if symmetry is not None:
+            levels = levels[symmetry.is_canonical(levels)]
+            if not len(levels):
+                continue
+        totals = layout.batch_total_inhabitants(levels)
+        best = int(np.argmax(totals))
+        if totals[best] > best_total:
+            best_total, best_levels = int(totals[best]), levels[best]
+    return best_total, best_levels
+
+
+def solve_component(
+    layout: Layout,
+    epochs: int,
+    strategy: Strategy,
+    seed: np.random.SeedSequence,
+    max_states: int = MAX_EXACT_STATES,
+    every: int = 1,
+    max_points: Optional[int] = MAX_POINTS,
+) -> Tuple[IntArray, Dict[str, Any]]:
+    """
+    Solves a component exactly if it has at most max_states level assignments
+    and runs the strategy on it otherwise. The totals are recorded in a
+    Progression with every and max_points.
+    :return: Best levels and the state of the progression
+    """
+    progression = Progression(every, max_points)
+    progression.record(0, layout.total)
+    if n_states(layout) <= max_states:
+        total, levels = solve_exact(layout, symmetry=Symmetry.detect(layout))
+        if epochs > 0:
+            progression.record(1, total)
+        if epochs > 1:
+            progression.record(epochs, total)
+        return levels, progression.state()
+    rng = np.random.default_rng(seed)
+    strategy.start(layout, epochs)
+    progression.start(epochs)
+    for epoch in range(1, epochs + 1):
+        strategy.step(rng)
+        progression.record(epoch, strategy.total)
+    return strategy.best_levels, progression.state()
+
+
+def optimize_components(
+    house_map: Map,
+    epochs: int,
+    n_change: int,
+    workers: int = 1,
+    seed: Optional[int] = None,
+    strategy: Optional[Strategy] = None,
+    max_states: int = MAX_EXACT_STATES,
+    progression: Optional[Progression] = None,
+) -> Tuple[Map, List[int]]:
+    """
+    Splits the map into houses that cannot influence each other and optimizes
+    every component on its own, largest first and in worker processes if
+    workers > 1. Components with at most max_states level assignments are
+    solved exactly. Every other component runs for the full number of epochs
+    with n_change scaled to its share of the houses. The components record
+    every epoch that is a multiple of the same interval, the summed totals at
+    those epochs are recorded in progression, by default one that keeps up to
+    MAX_POINTS.
+    :return: house_map and the recorded totals summed over components
+    """
+    strategy = Greedy(n_change) if strategy is None else strategy
+    if progression is None:
+        progression = Progression(max_points=MAX_POINTS)
+    every = progression.every
+    if progression.max_points is not None:
+        every = max(every, -(-(epochs + 1) // progression.max_points))
+    layout = house_map.layout
+    layout.reset(house_map.levels)
+    components = sorted(layout.components(), key=len, reverse=True)
+    seeds = np.random.SeedSequence(seed).spawn(len(components))
+    jobs = [
+        (
+            layout.subset(rows),
+            epochs,
+            strategy.scaled(len(rows) / layout.n),
+            component_seed,
+            max_states,
+            every,
+            progression.max_points,
+        )
+        for rows, component_seed in zip(components, seeds)
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(solve_component, *zip(*jobs)))
+    else:
+        results = [solve_component(*job) for job in jobs]
+    levels = layout.levels.copy()
+    aligned = np.unique(np.append(np.arange(0, epochs + 1, every), epochs))
+    totals = np.zeros(len(aligned), dtype=np.int64)
+    for rows, (component_levels, state) in zip(components, results):
+        levels[rows] = component_levels
+        totals += Progression.from_state(state).at(aligned)
+    for epoch, total in zip(aligned.tolist(), totals.tolist()):
+        progression.record(epoch, total)
+    layout.reset(levels)
+    layout.write_back(house_map)
+    return house_map, progression.tolist()
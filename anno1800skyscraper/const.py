@@ -33,3 +33,19 @@ class EngineerSkyscraper(Enum):
     A7_residence_SkyScraper_4lvl1 = 1
     A7_residence_SkyScraper_4lvl2 = 2
     A7_residence_SkyScraper_4lvl3 = 3
+
+
+# (housing option, level) of every skyscraper identifier used by Anno Designer
+SKYSCRAPER_IDENTIFIERS = {
+    **{e.name: (HousingOptions.ENGINEER.value, e.value) for e in EngineerSkyscraper},
+    **{e.name: (HousingOptions.INVESTOR.value, e.value) for e in InvestorSkyscraper},
+}
+
+ENGINEER_BASE_INHABITANTS = [136, 171, 196]
+ENGINEER_PANORAMA_INHABITANTS = [0, 50, 39, 40, 39, 41]
+
+INVESTOR_BASE_INHABITANTS = [197, 239, 283, 331, 381]
+INVESTOR_PANORAMA_INHABITANTS = [0, 80, 139, 193, 253, 319]
+
+MAX_DIST_BY_LEVEL = {1: 4, 2: 4.25, 3: 5, 4: 6, 5: 6.75}
+ADJACENCY_CUTOFF = 7
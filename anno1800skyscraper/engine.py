@@ -0,0 +1,493 @@
+from __future__ import annotations
+
+import itertools
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from anno1800skyscraper import profiling
+from anno1800skyscraper.const import (
+    HousingOptions,
+    ENGINEER_BASE_INHABITANTS,
+    ENGINEER_PANORAMA_INHABITANTS,
+    INVESTOR_BASE_INHABITANTS,
+    INVESTOR_PANORAMA_INHABITANTS,
+    MAX_DIST_BY_LEVEL,
+)
+from anno1800skyscraper.house import House
+
+if TYPE_CHECKING:
+    from anno1800skyscraper.map import Map
+
+IntArray = np.ndarray[Any, np.dtype[np.integer[Any]]]
+FloatArray = np.ndarray[Any, np.dtype[np.floating[Any]]]
+
+N_TYPES = len(HousingOptions)
+N_LEVELS = len(MAX_DIST_BY_LEVEL) + 1
+MAX_PANORAMA = 5
+
+
+def _build_compare_table() -> IntArray:
+    """
+    Lookup table of House.compare_house_levels indexed by
+    [own type, own level, other type, other level]. Entries for levels a
+    type cannot reach are left at 0 and never gathered.
+    """
+    table = np.zeros((N_TYPES, N_LEVELS, N_TYPES, N_LEVELS), dtype=np.int8)
+    houses = [
+        House(0, 0, level, house_type.value)
+        for house_type in HousingOptions
+        for level in range(1, House(0, 0, 1, house_type.value).max_level + 1)
+    ]
+    for own, other in itertools.product(houses, houses):
+        table[own.type.value, own.level, other.type.value, other.level] = (
+            House.compare_house_levels(own, other)
+        )
+    return table
+
+
+def _build_table(engineer: List[int], investor: List[int], offset: int) -> IntArray:
+    table = np.zeros((N_TYPES, N_LEVELS), dtype=np.int64)
+    table[HousingOptions.ENGINEER.value, offset : offset + len(engineer)] = engineer
+    table[HousingOptions.INVESTOR.value, offset : offset + len(investor)] = investor
+    return table
+
+
+COMPARE_TABLE = _build_compare_table()
+BASE_INHABITANTS = _build_table(
+    ENGINEER_BASE_INHABITANTS, INVESTOR_BASE_INHABITANTS, offset=1
+)
+PANORAMA_INHABITANTS = _build_table(
+    ENGINEER_PANORAMA_INHABITANTS, INVESTOR_PANORAMA_INHABITANTS, offset=0
+)
+RADIUS_BY_LEVEL = np.array(
+    [-1.0] + [House.max_dist_by_level(level) for level in range(1, N_LEVELS)]
+)
+MAX_LEVEL_BY_TYPE = np.array(
+    [House(0, 0, 1, house_type.value).max_level for house_type in HousingOptions],
+    dtype=np.uint8,
+)
+STATIC_ARRAYS = (
+    "x",
+    "y",
+    "types",
+    "indptr",
+    "src",
+    "indices",
+    "dists",
+    "rank",
+    "level_counts",
+)
+
+
+class Layout:
+    """
+    Struct-of-arrays representation of a Map. Houses are addressed by their
+    id, i.e. their position in Map.houses, neighbors are stored in CSR form
+    (indptr/indices) sorted by distance. level_counts[i, level] is the number
+    of neighbors within the radius of house i at that level, so the neighbors
+    that count for its panorama are always a prefix of its row. Scoring a level vector
+    reduces to a handful of gathers and one bincount.
+
+    The layout also carries a current level vector with its panoramas and
+    inhabitants. apply() changes levels in place and only rescores the changed
+    houses and their neighbors, revert() rolls the last apply() back.
+    """
+
+    def __init__(
+        self,
+        x: IntArray,
+        y: IntArray,
+        types: IntArray,
+        levels: IntArray,
+        indptr: IntArray,
+        indices: IntArray,
+    ):
+        self.x = np.asarray(x, dtype=np.int64)
+        self.y = np.asarray(y, dtype=np.int64)
+        self.types = np.asarray(types, dtype=np.uint8)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        src = np.repeat(np.arange(self.n), np.diff(self.indptr))
+        indices = np.asarray(indices, dtype=np.int64)
+        dists = np.sqrt(
+            (self.x[src] - self.x[indices]) ** 2 + (self.y[src] - self.y[indices]) ** 2
+        )
+        order = np.lexsort((dists, src))
+        self.src = src[order]
+        self.indices = indices[order]
+        self.dists = dists[order]
+        self.rank = np.arange(len(self.src)) - self.indptr[self.src]
+        self.level_counts = np.stack(
+            [
+                np.bincount(self.src, weights=self.dists <= radius, minlength=self.n)
+                for radius in RADIUS_BY_LEVEL
+            ],
+            axis=1,
+        ).astype(np.int64)
+        self._undo: Optional[Tuple[IntArray, IntArray, IntArray, IntArray, int]] = None
+        self.reset(levels)
+
+    @staticmethod
+    def from_arrays(arrays: Dict[str, IntArray], levels: IntArray) -> Layout:
+        """
+        Rebuilds a layout from the arrays of static_arrays() without copying
+        or recomputing them, e.g. from views into shared memory.
+        """
+        layout = Layout.__new__(Layout)
+        for name in STATIC_ARRAYS:
+            setattr(layout, name, arrays[name])
+        layout._undo = None
+        layout.reset(levels)
+        return layout
+
+    def static_arrays(self) -> Dict[str, IntArray]:
+        """The arrays that only depend on house positions and types."""
+        return {name: getattr(self, name) for name in STATIC_ARRAYS}
+
+    @property
+    def n(self) -> int:
+        return len(self.types)
+
+    @property
+    def max_levels(self) -> IntArray:
+        return MAX_LEVEL_BY_TYPE[self.types]
+
+    @staticmethod
+    def from_map(house_map: Map) -> Layout:
+        houses = list(house_map.houses.values())
+        indptr = [0]
+        indices: List[int] = []
+        for house in houses:
+            indices.extend(h.id for h in house.adjacency_map.houses)
+            indptr.append(len(indices))
+        return Layout(
+            x=np.array([h.x for h in houses], dtype=np.int64),
+            y=np.array([h.y for h in houses], dtype=np.int64),
+            types=np.array([h.type.value for h in houses], dtype=np.uint8),
+            levels=np.array([h.level for h in houses], dtype=np.uint8),
+            indptr=np.array(indptr, dtype=np.int64),
+            indices=np.array(indices, dtype=np.int64),
+        )
+
+    def reset(self, levels: IntArray) -> int:
+        self.levels = np.array(levels, dtype=np.uint8)
+        self.inhab = self.inhabitants(self.levels)
+        self.total = int(self.inhab.sum())
+        self._undo = None
+        return self.total
+
+    def subset(self, rows: IntArray) -> Layout:
+        """
+        Layout of the houses rows only, with neighbors outside of rows
+        dropped. Row k of the subset is house rows[k].
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        position = np.full(self.n, -1, dtype=np.int64)
+        position[rows] = np.arange(len(rows))
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        edges = self._edges(starts, counts)
+        keep = position[self.indices[edges]] >= 0
+        owner = np.repeat(np.arange(len(rows)), counts)[keep]
+        return Layout(
+            x=self.x[rows],
+            y=self.y[rows],
+            types=self.types[rows],
+            levels=self.levels[rows],
+            indptr=np.concatenate(
+                [[0], np.cumsum(np.bincount(owner, minlength=len(rows)))]
+            ),
+            indices=position[self.indices[edges][keep]],
+        )
+
+    def components(self) -> List[IntArray]:
+        """
+        Groups of houses that can influence each other's panorama, i.e. the
+        connected components of the graph linking every house to the
+        neighbors within the radius of its highest level.
+        """
+        interacting = self.rank < self.level_counts[self.src, self.max_levels[self.src]]
+        src, dst = self.src[interacting], self.indices[interacting]
+        labels = np.arange(self.n)
+        while True:
+            new = labels.copy()
+            np.minimum.at(new, src, labels[dst])
+            np.minimum.at(new, dst, labels[src])
+            new = new[new]
+            if (new == labels).all():
+                break
+            labels = new
+        _, inverse = np.unique(labels, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        splits = np.cumsum(np.bincount(inverse))[:-1]
+        return np.split(order, splits)
+
+    def neighbors(self, i: int, level: Optional[int] = None) -> IntArray:
+        """Houses within the radius of house i at the given or its current level."""
+        level = int(self.levels[i]) if level is None else level
+        start = self.indptr[i]
+        return self.indices[start : start + self.level_counts[i, level]]
+
+    def within_hops(self, idx: IntArray, hops: int) -> IntArray:
+        """Houses connected to idx by at most hops neighbor relations."""
+        houses = np.asarray(idx, dtype=np.int64)
+        for _ in range(hops):
+            starts = self.indptr[houses]
+            counts = self.indptr[houses + 1] - starts
+            houses = np.unique(
+                np.concatenate([houses, self.indices[self._edges(starts, counts)]])
+            )
+        return houses
+
+    def affected(self, idx: IntArray) -> IntArray:
+        """Houses whose panorama can change if the levels of idx change."""
+        starts = self.indptr[idx]
+        counts = self.indptr[idx + 1] - starts
+        edges = self._edges(starts, counts)
+        others = self.indices[edges]
+        sees = self.dists[edges] <= RADIUS_BY_LEVEL[self.levels[others]]
+        return np.unique(np.concatenate([idx, others[sees]]))
+
+    @staticmethod
+    def _edges(starts: IntArray, counts: IntArray) -> IntArray:
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return offsets + np.arange(counts.sum())
+
+    def _row_inhabitants(self, rows: IntArray) -> IntArray:
+        profiling.PROFILER.count("panorama_evaluations", len(rows))
+        levels = self.levels[rows]
+        types = self.types[rows]
+        counts = self.level_counts[rows, levels]
+        edges = self._edges(self.indptr[rows], counts)
+        owner = np.repeat(np.arange(len(rows)), counts)
+        others = self.indices[edges]
+        comparison = COMPARE_TABLE[
+            types[owner], levels[owner], self.types[others], self.levels[others]
+        ]
+        panorama = levels + np.bincount(
+            owner, weights=comparison, minlength=len(rows)
+        ).astype(np.int64)
+        panorama = np.clip(panorama, 0, MAX_PANORAMA)
+        return BASE_INHABITANTS[types, levels] + PANORAMA_INHABITANTS[types, panorama]
+
+    def move_gains(self, houses: IntArray, levels: IntArray) -> IntArray:
+        """
+        Change of the total for each single house move houses[m] -> levels[m]
+        on its own, evaluated in one vectorized pass without touching the
+        current state.
+        """
+        with profiling.PROFILER.phase("evaluate"):
+            return self._move_gains(
+                np.asarray(houses, dtype=np.int64), np.asarray(levels, dtype=np.int64)
+            )
+
+    def _move_gains(self, houses: IntArray, levels: IntArray) -> IntArray:
+        starts = self.indptr[houses]
+        counts = self.indptr[houses + 1] - starts
+        # Every move rescores the moved house and its whole neighbor row
+        move = np.concatenate(
+            [np.arange(len(houses)), np.repeat(np.arange(len(houses)), counts)]
+        )
+        rows = np.concatenate([houses, self.indices[self._edges(starts, counts)]])
+        profiling.PROFILER.count("panorama_evaluations", len(rows))
+        row_levels = np.where(
+            rows == houses[move], levels[move], self.levels[rows]
+        ).astype(np.int64)
+        edge_counts = self.level_counts[rows, row_levels]
+        edges = self._edges(self.indptr[rows], edge_counts)
+        pair = np.repeat(np.arange(len(rows)), edge_counts)
+        others = self.indices[edges]
+        other_levels = np.where(
+            others == houses[move[pair]], levels[move[pair]], self.levels[others]
+        )
+        row_types = self.types[rows]
+        comparison = COMPARE_TABLE[
+            row_types[pair], row_levels[pair], self.types[others], other_levels
+        ]
+        panorama = row_levels + np.bincount(
+            pair, weights=comparison, minlength=len(rows)
+        ).astype(np.int64)
+        panorama = np.clip(panorama, 0, MAX_PANORAMA)
+        new = (
+            BASE_INHABITANTS[row_types, row_levels]
+            + PANORAMA_INHABITANTS[row_types, panorama]
+        )
+        return np.bincount(
+            move, weights=new - self.inhab[rows], minlength=len(houses)
+        ).astype(np.int64)
+
+    def apply(self, idx: IntArray, levels: IntArray) -> int:
+        """
+        Sets the houses idx to the given levels in place.
+        :return: Change of total inhabitants
+        """
+        with profiling.PROFILER.phase("evaluate"):
+            return self._apply(idx, levels)
+
+    def _apply(self, idx: IntArray, levels: IntArray) -> int:
+        rows = self.affected(idx)
+        old = self.inhab[rows]
+        self._undo = (idx, self.levels[idx], rows, old, self.total)
+        self.levels[idx] = levels
+        new = self._row_inhabitants(rows)
+        self.inhab[rows] = new
+        delta = int(new.sum() - old.sum())
+        self.total += delta
+        return delta
+
+    def revert(self) -> None:
+        if self._undo is None:
+            raise ValueError("No move to revert")
+        idx, levels, rows, inhab, total = self._undo
+        self.levels[idx] = levels
+        self.inhab[rows] = inhab
+        self.total = total
+        self._undo = None
+
+    def propose(
+        self, rng: np.random.Generator, n_change: int
+    ) -> Tuple[IntArray, IntArray]:
+        """
+        Draws n_change houses (with replacement) and increments or decrements
+        each of them with equal probability, like House.increment_level and
+        House.decrement_level would.
+        """
+        with profiling.PROFILER.phase("propose"):
+            return self._propose(rng, n_change)
+
+    def _propose(
+        self, rng: np.random.Generator, n_change: int
+    ) -> Tuple[IntArray, IntArray]:
+        houses = rng.integers(0, self.n, n_change).tolist()
+        ups = (rng.random(n_change) < 0.5).tolist()
+        new_levels: dict[int, int] = {}
+        for house, up in zip(houses, ups):
+            level = new_levels.get(house, int(self.levels[house]))
+            if up:
+                new_levels[house] = min(
+                    int(MAX_LEVEL_BY_TYPE[self.types[house]]), level + 1
+                )
+            else:
+                new_levels[house] = max(1, level - 1)
+        return (
+            np.fromiter(new_levels.keys(), dtype=np.int64, count=len(new_levels)),
+            np.fromiter(new_levels.values(), dtype=np.uint8, count=len(new_levels)),
+        )
+
+    def greedy_step(
+        self, rng: np.random.Generator, n_change: int, batch_size: int = 1
+    ) -> bool:
+        """
+        Proposes batch_size mutations of n_change houses and keeps the best
+        one if it does not decrease the total.
+        :return: Whether a mutation was kept
+        """
+        if batch_size > 1:
+            candidates = self.propose_batch(rng, batch_size, n_change)
+            totals = self.batch_total_inhabitants(candidates)
+            best = int(np.argmax(totals))
+            if totals[best] < self.total:
+                return False
+            changed = np.flatnonzero(candidates[best] != self.levels)
+            self.apply(changed, candidates[best, changed])
+            return True
+        idx, levels = self.propose(rng, n_change)
+        if self.apply(idx, levels) < 0:
+            self.revert()
+            return False
+        return True
+
+    def write_back(self, house_map: Map, levels: Optional[IntArray] = None) -> None:
+        levels = self.levels if levels is None else levels
+        for house, level in zip(house_map.houses.values(), levels):
+            house.level = int(level)
+
+    def propose_batch(
+        self, rng: np.random.Generator, batch_size: int, n_change: int
+    ) -> IntArray:
+        """
+        batch_size candidate level vectors, each one the current levels with
+        the mutation of propose() applied.
+        """
+        candidates = np.repeat(self.levels[None, :], batch_size, axis=0)
+        return self.mutate_batch(rng, candidates, n_change)
+
+    def mutate_batch(
+        self, rng: np.random.Generator, candidates: IntArray, n_change: int
+    ) -> IntArray:
+        """Applies the mutation of propose() to every row of candidates in place."""
+        with profiling.PROFILER.phase("propose"):
+            return self._mutate_batch(rng, candidates, n_change)
+
+    def _mutate_batch(
+        self, rng: np.random.Generator, candidates: IntArray, n_change: int
+    ) -> IntArray:
+        batch_size = len(candidates)
+        houses = rng.integers(0, self.n, (batch_size, n_change))
+        ups = rng.random((batch_size, n_change)) < 0.5
+        rows = np.arange(batch_size)
+        for change in range(n_change):
+            house = houses[:, change]
+            level = candidates[rows, house]
+            candidates[rows, house] = np.where(
+                ups[:, change],
+                np.minimum(level + 1, MAX_LEVEL_BY_TYPE[self.types[house]]),
+                np.maximum(level, 2) - 1,
+            )
+        return candidates
+
+    def panoramas(self, levels: Optional[IntArray] = None) -> IntArray:
+        """
+        Panoramas for a level vector of shape (n,) or a batch of level vectors
+        of shape (k, n).
+        """
+        levels = self.levels if levels is None else levels
+        own = levels[..., self.src]
+        comparison = COMPARE_TABLE[
+            self.types[self.src],
+            own,
+            self.types[self.indices],
+            levels[..., self.indices],
+        ]
+        comparison = np.where(
+            self.rank < self.level_counts[self.src, own], comparison, 0
+        )
+        cumulative = np.zeros(levels.shape[:-1] + (len(self.src) + 1,), dtype=np.int64)
+        np.cumsum(comparison, axis=-1, out=cumulative[..., 1:])
+        panorama = (
+            levels
+            + cumulative[..., self.indptr[1:]]
+            - cumulative[..., self.indptr[:-1]]
+        )
+        return np.clip(panorama, 0, MAX_PANORAMA)
+
+    def inhabitants(self, levels: Optional[IntArray] = None) -> IntArray:
+        levels = self.levels if levels is None else levels
+        profiling.PROFILER.count("panorama_evaluations", levels.size)
+        return (
+            BASE_INHABITANTS[self.types, levels]
+            + PANORAMA_INHABITANTS[self.types, self.panoramas(levels)]
+        )
+
+    def total_inhabitants(self, levels: Optional[IntArray] = None) -> int:
+        return int(self.inhabitants(levels).sum())
+
+    def batch_total_inhabitants(
+        self, levels: IntArray, max_entries: int = 2**22
+    ) -> IntArray:
+        """
+        Total inhabitants of each row of a (k, n) batch of level vectors,
+        scored in chunks of rows with at most max_entries edge entries.
+        """
+        chunk = max(1, max_entries // max(len(self.src), 1))
+        with profiling.PROFILER.phase("evaluate"):
+            return self._batch_totals(levels, chunk)
+
+    def _batch_totals(self, levels: IntArray, chunk: int) -> IntArray:
+        return np.concatenate(
+            [
+                self.inhabitants(levels[start : start + chunk]).sum(axis=-1)
+                for start in range(0, len(levels), chunk)
+            ]
+            or [np.zeros(0, dtype=np.int64)]
+        )
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import time
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from anno1800skyscraper.engine import (
+    Layout,
+    IntArray,
+    COMPARE_TABLE,
+    BASE_INHABITANTS,
+    PANORAMA_INHABITANTS,
+    MAX_LEVEL_BY_TYPE,
+    MAX_PANORAMA,
+    N_LEVELS,
+    N_TYPES,
+)
+from anno1800skyscraper.symmetry import Symmetry
+
+if TYPE_CHECKING:
+    from anno1800skyscraper.map import Map
+
+UNASSIGNED = 0
+
+
+def _bound_tables() -> Tuple[List[List[List[int]]], List[List[List[int]]]]:
+    """
+    Largest and smallest panorama contribution a house of type other_type can
+    make to a house of type own_type at own_level, indexed by
+    [own_type][own_level][other_type].
+    """
+    best = [[[0] * N_TYPES for _ in range(N_LEVELS)] for _ in range(N_TYPES)]
+    worst = [[[0] * N_TYPES for _ in range(N_LEVELS)] for _ in range(N_TYPES)]
+    for own_type in range(N_TYPES):
+        for own_level in range(1, N_LEVELS):
+            for other_type in range(N_TYPES):
+                values = COMPARE_TABLE[
+                    own_type,
+                    own_level,
+                    other_type,
+                    1 : MAX_LEVEL_BY_TYPE[other_type] + 1,
+                ]
+                best[own_type][own_level][other_type] = int(values.max())
+                worst[own_type][own_level][other_type] = int(values.min())
+    return best, worst
+
+
+def _best_bonus_table() -> List[List[List[int]]]:
+    """
+    Largest panorama bonus for a panorama anywhere in [low, high], indexed by
+    [type][low][high]. The bonus is not monotonic in the panorama.
+    """
+    table = [
+        [[0] * (MAX_PANORAMA + 1) for _ in range(MAX_PANORAMA + 1)]
+        for _ in range(N_TYPES)
+    ]
+    for house_type in range(N_TYPES):
+        for low in range(MAX_PANORAMA + 1):
+            for high in range(low, MAX_PANORAMA + 1):
+                table[house_type][low][high] = int(
+                    PANORAMA_INHABITANTS[house_type, low : high + 1].max()
+                )
+    return table
+
+
+BEST_COMPARE, WORST_COMPARE = _bound_tables()
+BEST_BONUS = _best_bonus_table()
+COMPARE: List[List[List[List[int]]]] = COMPARE_TABLE.tolist()
+BASE: List[List[int]] = BASE_INHABITANTS.tolist()
+
+
+def upper_bound(layout: Layout) -> int:
+    """
+    Upper bound of the total of any level assignment. Every house is scored
+    at its best level with the panorama bonus maximized over the range its
+    neighbors can produce, taking each of them at its least and most
+    favorable level independently.
+    """
+    best_compare = np.array(BEST_COMPARE)
+    worst_compare = np.array(WORST_COMPARE)
+    best_bonus = np.array(BEST_BONUS)
+    own_types = layout.types[layout.src]
+    other_types = layout.types[layout.indices]
+    bound = np.zeros(layout.n, dtype=np.int64)
+    for level in range(1, N_LEVELS):
+        valid = layout.max_levels >= level
+        counted = layout.rank < layout.level_counts[layout.src, level]
+        sums = [
+            np.bincount(
+                layout.src,
+                weights=np.where(counted, table[own_types, level, other_types], 0),
+                minlength=layout.n,
+            ).astype(np.int64)
+            for table in (worst_compare, best_compare)
+        ]
+        low, high = (np.clip(level + total, 0, MAX_PANORAMA) for total in sums)
+        value = (
+            BASE_INHABITANTS[layout.types, level] + best_bonus[layout.types, low, high]
+        )
+        bound = np.where(valid, np.maximum(bound, value), bound)
+    return int(bound.sum())
+
+
+def optimality_gap(total: int, bound: int) -> float:
+    """Share of the upper bound that total is at most away from the optimum."""
+    return (bound - total) / bound if bound > 0 else 0.0
+
+
+class _Timeout(Exception):
+    pass
+
+
+class BranchAndBound:
+    """
+    Exact search over the levels of the houses in free with all other houses
+    held at their current level. Houses are assigned in order of the number of
+    already ordered neighbors, then of their total neighbor count, so that
+    panoramas are settled early. A partial assignment is bounded by the sum over every
+    house whose panorama it touches of the most inhabitants that house could
+    still reach, taking every unassigned neighbor at its most favorable
+    level. The bound is kept up to date incrementally, only the assigned
+    house and its neighbors are rescored. If all houses are free and a
+    symmetry is given, only assignments that are lexicographically smallest,
+    in assignment order, among their symmetric images are searched.
+    """
+
+    def __init__(
+        self,
+        layout: Layout,
+        free: Optional[IntArray] = None,
+        time_limit: Optional[float] = None,
+        symmetry: Optional[Symmetry] = None,
+    ):
+        self.layout = layout
+        free = np.arange(layout.n) if free is None else np.asarray(free)
+        self.time_limit = time_limit
+        self.scope = layout.affected(free).tolist()
+        in_scope = set(self.scope)
+        self.constant = layout.total - int(layout.inhab[self.scope].sum())
+        self.types: List[int] = layout.types.tolist()
+        self.max_levels: List[int] = layout.max_levels.tolist()
+        self.rows: Dict[int, List[int]] = {
+            i: layout.indices[layout.indptr[i] : layout.indptr[i + 1]].tolist()
+            for i in self.scope
+        }
+        self.counts: Dict[int, List[int]] = dict(
+            zip(self.scope, layout.level_counts[self.scope].tolist())
+        )
+        self.order = self._ordering(free.tolist())
+        self.touched = {
+            i: [i] + [j for j in self.rows[i] if j in in_scope] for i in self.order
+        }
+        self.symmetries = self._symmetries(symmetry, len(free) == layout.n)
+        self.levels: List[int] = layout.levels.tolist()
+        self.best_levels = layout.levels.copy()
+        self.best_value = int(layout.inhab[self.scope].sum())
+        for i in self.order:
+            self.levels[i] = UNASSIGNED
+        self.bounds = {i: self._house_bound(i) for i in self.scope}
+        self.bound = sum(self.bounds.values())
+        self.nodes = 0
+        self.optimal = False
+
+    def _ordering(self, free: List[int]) -> List[int]:
+        remaining = set(free)
+        ordered_neighbors = dict.fromkeys(free, 0)
+        order = []
+        while remaining:
+            i = max(
+                remaining, key=lambda j: (ordered_neighbors[j], len(self.rows[j]), -j)
+            )
+            remaining.remove(i)
+            order.append(i)
+            for j in self.rows[i]:
+                if j in remaining:
+                    ordered_neighbors[j] += 1
+        return order
+
+    def _symmetries(
+        self, symmetry: Optional[Symmetry], all_free: bool
+    ) -> List[Tuple[List[int], List[int]]]:
+        """
+        For every symmetry other than the identity, the house each assigned
+        house maps to and the depth at which that house is assigned.
+        """
+        if symmetry is None or not all_free:
+            return []
+        depth = {i: k for k, i in enumerate(self.order)}
+        symmetries = []
+        for perm in symmetry.perms.tolist():
+            if perm == sorted(perm):
+                continue
+            images = [perm[i] for i in self.order]
+            symmetries.append((images, [depth[j] for j in images]))
+        return symmetries
+
+    def _is_lex_leader(self, depth: int) -> bool:
+        for images, image_depths in self.symmetries:
+            for k in range(depth):
+                if image_depths[k] >= depth:
+                    break
+                own, image = self.levels[self.order[k]], self.levels[images[k]]
+                if own != image:
+                    if own > image:
+                        return False
+                    break
+        return True
+
+    @property
+    def best_total(self) -> int:
+        return self.constant + self.best_value
+
+    def _level_bound(self, i: int, level: int) -> int:
+        house_type = self.types[i]
+        low = high = level
+        for j in self.rows[i][: self.counts[i][level]]:
+            other = self.levels[j]
+            if other == UNASSIGNED:
+                low += WORST_COMPARE[house_type][level][self.types[j]]
+                high += BEST_COMPARE[house_type][level][self.types[j]]
+            else:
+                comparison = COMPARE[house_type][level][self.types[j]][other]
+                low += comparison
+                high += comparison
+        low = min(max(low, 0), MAX_PANORAMA)
+        high = min(max(high, 0), MAX_PANORAMA)
+        return BASE[house_type][level] + BEST_BONUS[house_type][low][high]
+
+    def _house_bound(self, i: int) -> int:
+        if self.levels[i] != UNASSIGNED:
+            return self._level_bound(i, self.levels[i])
+        return max(
+            self._level_bound(i, level) for level in range(1, self.max_levels[i] + 1)
+        )
+
+    def _assign(self, i: int, level: int) -> None:
+        self.levels[i] = level
+        for j in self.touched[i]:
+            bound = self._house_bound(j)
+            self.bound += bound - self.bounds[j]
+            self.bounds[j] = bound
+
+    def _search(self) -> None:
+        """
+        Depth first search over the houses in order. The stack holds the
+        levels left to try at every depth with their bounds, best last, so
+        the depth of the search is not limited by the recursion limit.
+        """
+        stack: List[List[Tuple[int, int]]] = []
+        expand = True
+        while True:
+            depth = len(stack)
+            if expand:
+                self.nodes += 1
+                if (
+                    self.time_limit is not None
+                    and self.nodes % 1024 == 0
+                    and time.perf_counter() > self.deadline
+                ):
+                    raise _Timeout
+                options = []
+                if depth == len(self.order):
+                    if self.bound > self.best_value:
+                        self.best_value = self.bound
+                        self.best_levels = np.array(self.levels, dtype=np.uint8)
+                else:
+                    i = self.order[depth]
+                    for level in range(1, self.max_levels[i] + 1):
+                        self._assign(i, level)
+                        options.append((self.bound, level))
+                    options.sort()
+                stack.append(options)
+                depth += 1
+            options = stack[-1]
+            if options and options[-1][0] > self.best_value:
+                _, level = options.pop()
+                self._assign(self.order[depth - 1], level)
+                expand = self._is_lex_leader(depth)
+                continue
+            stack.pop()
+            if depth <= len(self.order):
+                self._assign(self.order[depth - 1], UNASSIGNED)
+            if not stack:
+                return
+            expand = False
+
+    def solve(self) -> Tuple[int, IntArray, bool]:
+        """
+        :return: Best total of the layout, its levels and whether the search
+        finished, i.e. the levels are proven optimal
+        """
+        self.deadline = time.perf_counter() + (self.time_limit or 0)
+        try:
+            self._search()
+            self.optimal = True
+        except _Timeout:
+            pass
+        return self.best_total, self.best_levels, self.optimal
+
+
+def optimize_exact(
+    house_map: Map, time_limit: Optional[float] = None
+) -> Tuple[Map, bool]:
+    """
+    Runs branch and bound over all houses of the map, starting from its
+    current levels as the incumbent. Stops after time_limit seconds and keeps
+    the best levels found so far. Assignments that are symmetric to one
+    already searched are skipped.
+    :return: house_map and whether its levels are proven optimal
+    """
+    layout = house_map.layout
+    layout.reset(house_map.levels)
+    _, levels, optimal = BranchAndBound(
+        layout, time_limit=time_limit, symmetry=house_map.symmetries()
+    ).solve()
+    layout.reset(levels)
+    layout.write_back(house_map)
+    return house_map, optimal
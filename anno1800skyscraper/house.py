@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import hashlib
+import bisect
 import math
-from typing import Dict
+from typing import Dict, List, Optional
 
 import numpy as np
 
@@ -12,42 +12,98 @@ from anno1800skyscraper.const import (
     InvestorSkyscraper,
     INVESTORSKYSCRAPERCOLORS,
     ENGINEERSKYSCRAPERCOLORS,
+    ENGINEER_BASE_INHABITANTS,
+    ENGINEER_PANORAMA_INHABITANTS,
+    INVESTOR_BASE_INHABITANTS,
+    INVESTOR_PANORAMA_INHABITANTS,
+    MAX_DIST_BY_LEVEL,
+    ADJACENCY_CUTOFF,
 )
 
 
 class AdjacencyMap:
+    """
+    Neighbors of a house within ADJACENCY_CUTOFF, keyed by House.id. Houses
+    that are not part of a Map yet all have the id -1 and are kept in a list
+    instead, compared by identity. Besides the dict the neighbors are kept
+    sorted by distance, together with one prefix of that list per level, so
+    that the houses within the radius of a given level can be looked up without
+    any distance calculations.
+    """
+
+    __slots__ = ("center_house", "_adjacents", "_standalone", "_by_level")
+
     def __init__(self, center_house: House):
         self.center_house: House = center_house
-        self.adjacents: dict[str, House] = {}
+        self._by_level: Optional[List[List[House]]] = None
+        self._standalone: List[House] = []
+        self.adjacents: dict[int, House] = {}
 
     def add_adjacency(self, house: House) -> None:
-        if house == self.center_house:
+        if house is self.center_house:
             return
         if (
             math.sqrt(
                 (self.center_house.x - house.x) ** 2
                 + (self.center_house.y - house.y) ** 2
             )
-            > 7
+            > ADJACENCY_CUTOFF
         ):
             return
         if self.in_adjacency(house):
             return
-        self.adjacents[house.id] = house
+        if house.id >= 0:
+            self.adjacents[house.id] = house
+        else:
+            self._standalone.append(house)
+        self._by_level = None
 
     def in_adjacency(self, house: House) -> bool:
-        return house.id in self.adjacents.keys()
+        if self.adjacents.get(house.id) is house:
+            return True
+        return any(other is house for other in self._standalone)
+
+    @property
+    def houses(self) -> List[House]:
+        """All neighbors, including those that are not part of a Map."""
+        return list(self.adjacents.values()) + self._standalone
 
     @property
-    def adjacents(self) -> dict[str, House]:
+    def adjacents(self) -> dict[int, House]:
         return self._adjacents
 
     @adjacents.setter
-    def adjacents(self, value: dict[str, House]) -> None:
+    def adjacents(self, value: dict[int, House]) -> None:
         self._adjacents = value
+        self._by_level = None
+
+    def within_level(self, level: int) -> List[House]:
+        """Neighbors within the radius of a house of the given level."""
+        if self._by_level is None:
+            self._by_level = self._sort_by_level()
+        return self._by_level[level]
+
+    def _sort_by_level(self) -> List[List[House]]:
+        houses = sorted(
+            self.houses,
+            key=lambda h: House.calc_house_distance(self.center_house, h),
+        )
+        dists = [House.calc_house_distance(self.center_house, h) for h in houses]
+        by_level: List[List[House]] = [[]]
+        for level in MAX_DIST_BY_LEVEL.keys():
+            count = bisect.bisect_right(dists, House.max_dist_by_level(level))
+            by_level.append(houses[:count])
+        return by_level
 
 
 class House:
+    """
+    A skyscraper of a given type and level with its lower left corner at (x, y).
+    id is the index of the house in the Map it was added to and -1 before.
+    """
+
+    __slots__ = ("x", "y", "type", "_level", "adjacency_map", "id")
+
     def __init__(self, x: int, y: int, level: int, house_type: int):
         if not isinstance(x, (int, np.integer)) or not isinstance(y, (int, np.integer)):
             raise ValueError(
@@ -60,10 +116,7 @@ class House:
         self.type: HousingOptions = HousingOptions(house_type)
         self.level: int = level
         self.adjacency_map = AdjacencyMap(self)
-
-    @property
-    def id(self) -> str:
-        return hashlib.sha256(str(id(self)).encode("ASCII")).hexdigest()[:8]
+        self.id: int = -1
 
     @property
     def max_level(self) -> int:
@@ -99,17 +152,17 @@ class House:
     @property
     def panorama(self) -> int:
         panorama = self.level
-        for house in self.adjacents.values():
+        for house in self.adjacent_houses:
             panorama += self.compare_house_levels(self, house)
-        return int(np.clip(panorama, 0, 5))
+        return min(max(panorama, 0), 5)
+
+    @property
+    def adjacent_houses(self) -> List[House]:
+        return self.adjacency_map.within_level(self.level)
 
     @property
-    def adjacents(self) -> dict[str, House]:
-        return {
-            house.id: house
-            for house in self.adjacency_map.adjacents.values()
-            if self.calc_house_distance(self, house) <= self.radius
-        }
+    def adjacents(self) -> dict[int, House]:
+        return {house.id: house for house in self.adjacent_houses}
 
     @staticmethod
     def compare_house_levels(own: House, other: House) -> int:
@@ -129,10 +182,9 @@ class House:
 
     @staticmethod
     def max_dist_by_level(level: int) -> float:
-        vals = {1: 4, 2: 4.25, 3: 5, 4: 6, 5: 6.75}
-        if level not in vals.keys():
+        if level not in MAX_DIST_BY_LEVEL.keys():
             raise ValueError
-        out = vals.get(level)
+        out = MAX_DIST_BY_LEVEL.get(level)
         if out is None:
             raise KeyError
         return out
@@ -149,13 +201,17 @@ class House:
 
     @property
     def __eng_inhabitants(self) -> int:
-        return [136, 171, 196][self.level - 1] + [0, 50, 39, 40, 39, 41][self.panorama]
+        return (
+            ENGINEER_BASE_INHABITANTS[self.level - 1]
+            + ENGINEER_PANORAMA_INHABITANTS[self.panorama]
+        )
 
     @property
     def __inv_inhabitants(self) -> int:
-        return [197, 239, 283, 331, 381][self.level - 1] + [0, 80, 139, 193, 253, 319][
-            self.panorama
-        ]
+        return (
+            INVESTOR_BASE_INHABITANTS[self.level - 1]
+            + INVESTOR_PANORAMA_INHABITANTS[self.panorama]
+        )
 
     @property
     def annoDesignerIdentifier(self) -> EngineerSkyscraper | InvestorSkyscraper:
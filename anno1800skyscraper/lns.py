@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from tqdm import trange
+from tqdm.std import tqdm
+
+from anno1800skyscraper.engine import IntArray
+from anno1800skyscraper.exact import BranchAndBound
+
+if TYPE_CHECKING:
+    from anno1800skyscraper.map import Map
+
+
+def window(house_map: Map, center: int, radius: float, max_size: int) -> IntArray:
+    """The at most max_size houses closest to center within radius tiles."""
+    house = house_map.house_by_id(center)
+    houses = house_map.houses_within(house.x, house.y, radius)
+    houses.sort(key=lambda h: (h.x - house.x) ** 2 + (h.y - house.y) ** 2)
+    return np.array([h.id for h in houses[:max_size]], dtype=np.int64)
+
+
+def polish(
+    house_map: Map,
+    rounds: int,
+    radius: float = 6,
+    max_size: int = 8,
+    time_limit: Optional[float] = 2,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[Map, List[int]]:
+    """
+    Large neighborhood search. Every round picks a random house, frees the
+    at most max_size houses closest to it within radius tiles and solves
+    their levels exactly with branch and bound while all other houses keep
+    their level. Houses outside of the window whose panorama depends on it
+    are part of the objective. A round that does not finish within
+    time_limit seconds keeps the best levels it found.
+    :return: house_map and the total after every round
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    layout = house_map.layout
+    layout.reset(house_map.levels)
+    round_range: tqdm = trange(rounds, unit="window")  # type: ignore
+    pops = [layout.total]
+    for _ in round_range:
+        free = window(house_map, int(rng.integers(layout.n)), radius, max_size)
+        total, levels, _ = BranchAndBound(layout, free, time_limit).solve()
+        if total > layout.total:
+            layout.apply(free, levels[free])
+        pops.append(layout.total)
+        round_range.set_postfix({"Total": str(layout.total)})
+    layout.write_back(house_map)
+    return house_map, pops
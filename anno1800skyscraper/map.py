@@ -1,22 +1,34 @@
 from __future__ import annotations
 
-import copy
-import itertools
 import json
+import time
 from pathlib import Path, PosixPath
-from typing import List, Dict, Any, Union, Optional, Tuple
+from typing import List, Dict, Any, Union, Optional, Sequence, Tuple, TYPE_CHECKING
 
-import matplotlib
 import numpy as np
-from matplotlib import colors
-from matplotlib.colors import LinearSegmentedColormap, Colormap
-from matplotlib.patches import Rectangle
 from tqdm import trange
 from tqdm.std import tqdm
 
-from anno1800skyscraper.const import InvestorSkyscraper, EngineerSkyscraper
+from anno1800skyscraper import profiling
+from anno1800skyscraper.adaptive import AdaptiveController
+from anno1800skyscraper.const import ADJACENCY_CUTOFF, SKYSCRAPER_IDENTIFIERS
+from anno1800skyscraper.engine import Layout
+from anno1800skyscraper.exact import optimality_gap, upper_bound
 from anno1800skyscraper.house import House
-from utils.figures import open_figure, save_figure
+from anno1800skyscraper.progression import MAX_POINTS, Progression
+from anno1800skyscraper.spatial import SpatialGrid
+from anno1800skyscraper.strategies import Strategy, Greedy
+from anno1800skyscraper.symmetry import Symmetry
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+
+    from matplotlib.colors import LinearSegmentedColormap, Colormap
+
+    from anno1800skyscraper.checkpoint import Checkpoint
+    from anno1800skyscraper.render import HouseMapImage
+
+EMPTY = -1
 
 
 class Map:
@@ -27,36 +39,43 @@ class Map:
         self.height = height + 2
         self.x_offset = x_offset
         self.y_offset = y_offset
-        self.coord_map: np.ndarray[Any, np.dtype[np.bytes_]] = np.char.chararray(
-            (self.width, self.height), itemsize=8
+        self.coord_map: np.ndarray[Any, np.dtype[np.int32]] = np.full(
+            (self.width, self.height), EMPTY, dtype=np.int32
         )
-        self.coord_map[:] = ""
-        self.houses: dict[str, House] = {}
+        self.houses: dict[int, House] = {}
+        self.positions: dict[Tuple[int, int], int] = {}
+        self.grid = SpatialGrid()
         self.ad_file: Union[str, Path, PosixPath] = ""
         self.file_contents: Dict[Any, Any] = {}
+        self._layout: Optional[Layout] = None
 
     @property
-    def house_hashes(self) -> List[str]:
+    def house_ids(self) -> List[int]:
         return list(self.houses.keys())
 
     def house_exists(self, house: House) -> bool:
-        return house.id in self.house_hashes
+        return self.houses.get(house.id) is house
 
     def house_by_coords(self, x: int, y: int) -> Optional[House]:
         coords = self.coord_map[x : x + 3, y : y + 3].flatten()
-        hashes = np.unique(coords)
-        if len(hashes) != 1:
+        ids = np.unique(coords)
+        if len(ids) != 1:
             raise ValueError(f"Coordinates ({x}, {y}) not of unique house")
-        if not hashes[0]:
+        if ids[0] == EMPTY:
             return None
-        return self.house_by_hash(hashes[0])
+        return self.house_by_id(int(ids[0]))
 
-    def house_by_hash(self, hash_str: str) -> House:
-        house: Optional[House] = self.houses.get(hash_str)
+    def house_by_id(self, house_id: int) -> House:
+        house: Optional[House] = self.houses.get(house_id)
         if not house:
             raise KeyError
         return house
 
+    def house_at(self, x: int, y: int) -> Optional[House]:
+        """The house whose top left corner is at (x, y), if any."""
+        house_id = self.positions.get((x, y))
+        return None if house_id is None else self.houses[house_id]
+
     def add_house(self, house: House) -> None:
         if house.x + 3 > self.width or house.y + 3 > self.height:
             raise ValueError(
@@ -65,128 +84,197 @@ class Map:
             )
         if self.house_exists(house):
             raise ValueError("House already exists")
-        if self.house_by_coords(house.x, house.y):
+        if house.id >= 0:
+            raise ValueError("House already belongs to another map")
+        if (
+            self.coord_map[house.x : house.x + 3, house.y : house.y + 3] != EMPTY
+        ).any():
             raise ValueError("Placement for house occupied")
+        house.id = len(self.houses)
         self.coord_map[house.x : house.x + 3, house.y : house.y + 3] = house.id
+        self._register(house)
+
+    def add_houses(self, houses: List[House]) -> None:
+        """
+        Adds many houses with the same checks as add_house, but places all of
+        them in the coord map at once.
+        """
+        if not houses:
+            return
+        x = np.fromiter((h.x for h in houses), dtype=np.int64, count=len(houses))
+        y = np.fromiter((h.y for h in houses), dtype=np.int64, count=len(houses))
+        if (
+            min(x.min(), y.min()) < 0
+            or x.max() + 3 > self.width
+            or y.max() + 3 > self.height
+        ):
+            raise ValueError(
+                f"House placement outside of map borders, map has borders "
+                f"{self.width, self.height}"
+            )
+        if len({id(h) for h in houses}) < len(houses) or any(
+            self.house_exists(h) for h in houses
+        ):
+            raise ValueError("House already exists")
+        if any(h.id >= 0 for h in houses):
+            raise ValueError("House already belongs to another map")
+        tiles_x = (x[:, None] + np.repeat(np.arange(3), 3)).ravel()
+        tiles_y = (y[:, None] + np.tile(np.arange(3), 3)).ravel()
+        tiles = tiles_x * self.height + tiles_y
+        if (self.coord_map[tiles_x, tiles_y] != EMPTY).any() or len(
+            np.unique(tiles)
+        ) < len(tiles):
+            raise ValueError("Placement for house occupied")
+        ids = np.arange(len(self.houses), len(self.houses) + len(houses))
+        self.coord_map[tiles_x, tiles_y] = np.repeat(ids, 9)
+        for house, house_id in zip(houses, ids.tolist()):
+            house.id = house_id
+            self._register(house)
+
+    def _register(self, house: House) -> None:
         self.houses[house.id] = house
+        self.positions[(house.x, house.y)] = house.id
+        self.grid.insert(house)
+        self._layout = None
+
+    def houses_within(self, x: float, y: float, radius: float) -> List[House]:
+        return self.grid.query(x, y, radius)
 
     @staticmethod
-    def optimize(house_map: Map, epochs: int, n_change: int) -> Tuple[Map, List[int]]:
-        epoch_range: tqdm = trange(epochs, unit="epoch")  # type: ignore
-        pops = [house_map.total_inhabitants]
+    def optimize(
+        house_map: Map,
+        epochs: int,
+        n_change: int,
+        rng: Optional[np.random.Generator] = None,
+        batch_size: int = 1,
+        strategy: Optional[Strategy] = None,
+        gap_tolerance: Optional[float] = None,
+        controller: Optional[AdaptiveController] = None,
+        checkpoint: Optional[Union[str, Path, PosixPath]] = None,
+        checkpoint_every: float = 300,
+        resume: Optional[Checkpoint] = None,
+        progress: bool = True,
+        progression: Optional[Progression] = None,
+    ) -> Tuple[Map, List[int]]:
+        """
+        Optimizes the levels of house_map in place. Without a strategy this
+        greedily keeps mutations of n_change houses that do not decrease the
+        total, otherwise the strategy decides and n_change and batch_size are
+        ignored. The best levels seen are written back to house_map. The run
+        stops early once the gap between the best total and the upper bound
+        of the map is at most gap_tolerance. A controller adapts n_change of
+        the strategy during the run and stops it once it has converged.
+        With a checkpoint file, the state of the run is saved to it every
+        checkpoint_every seconds and at the end. A run continues from resume,
+        which has to come from the same map and strategy, until it reaches
+        epochs in total. Without progress no progress bar is shown. The
+        totals are recorded in progression, by default one for every epoch up
+        to MAX_POINTS.
+        :return: house_map and the recorded totals of progression
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        strategy = Greedy(n_change, batch_size) if strategy is None else strategy
+        layout = house_map.layout
+        layout.reset(house_map.levels if resume is None else resume.levels)
+        strategy.start(layout, epochs)
+        if progression is None:
+            progression = Progression(max_points=MAX_POINTS)
+        progression.start(epochs)
+        if resume is not None:
+            resume.restore(strategy, rng)
+            progression.restore(resume.progression)
+        else:
+            progression.record(strategy.epoch, layout.total)
+        if controller is not None:
+            controller.start(strategy)
+        if checkpoint is not None:
+            from anno1800skyscraper.checkpoint import Checkpoint
+        bound = house_map.upper_bound
+        epoch_range: tqdm = trange(  # type: ignore
+            strategy.epoch,
+            epochs,
+            initial=strategy.epoch,
+            total=epochs,
+            unit="epoch",
+            disable=not progress,
+        )
+        next_checkpoint = time.monotonic() + checkpoint_every
+        profiler = profiling.PROFILER
         for _ in epoch_range:
-            house_map_new = copy.deepcopy(house_map)
-            house_keys = np.random.choice(list(house_map_new.houses.keys()), n_change)
-            for key in house_keys:
-                house = house_map_new.house_by_hash(key)
-                if np.random.random() < 0.5:
-                    house.increment_level()
-                else:
-                    house.decrement_level()
-            if house_map_new.total_inhabitants >= house_map.total_inhabitants:
-                house_map = house_map_new
-            tot = house_map.total_inhabitants
-            pops.append(tot)
-            epoch_range.set_postfix({"Total": str(tot)})
-        return house_map, pops
+            with profiler.phase("step"):
+                strategy.step(rng)
+            progression.record(strategy.epoch, strategy.total)
+            if checkpoint is not None and time.monotonic() >= next_checkpoint:
+                with profiler.phase("checkpoint"):
+                    Checkpoint.from_run(strategy, rng, progression).save(checkpoint)
+                next_checkpoint = time.monotonic() + checkpoint_every
+            with profiler.phase("bookkeeping"):
+                gap = optimality_gap(strategy.best_total, bound)
+                postfix = {"Total": str(strategy.total), "Gap": f"{gap:.2%}"}
+                converged = controller is not None and controller.update()
+                if controller is not None:
+                    postfix["Change"] = str(strategy.n_change)
+                    postfix["Accept"] = f"{controller.acceptance_rate:.0%}"
+                epoch_range.set_postfix(postfix)
+            if profiler.enabled:
+                profiler.emit(
+                    "epoch",
+                    epoch=strategy.epoch,
+                    total=strategy.total,
+                    best_total=strategy.best_total,
+                )
+            if converged or gap_tolerance is not None and gap <= gap_tolerance:
+                break
+        if checkpoint is not None:
+            Checkpoint.from_run(strategy, rng, progression).save(checkpoint)
+        layout.reset(strategy.best_levels)
+        layout.write_back(house_map)
+        return house_map, progression.tolist()
 
+    @profiling.timed("render")
     def print_housemap(
         self,
         verbose: bool = False,
         print_labels: bool = False,
         filename: Optional[Union[str, Path, PosixPath]] = None,
+        dpi: float = 600,
+        formats: Sequence[str] = ("png",),
+        background: bool = False,
         **kwargs: Any,
-    ) -> None:
+    ) -> Optional[BaseProcess]:
+        """
+        Draws the levels and the panoramas of the map and saves them to
+        filename in every format. With background, the figures are drawn in a
+        separate process that is returned and never shown.
+        """
+        # Plotting is imported on first use, so runs without plots never load it
+        from anno1800skyscraper.render import render_housemap, render_in_background
+
         if verbose:
             for house in self.houses.values():
                 print(house)
-        if not isinstance(filename, Path) and filename is not None:
-            filename = Path(filename)
         print(f"Total inhabitants: {self.total_inhabitants}")
-        cat_map = self.categorical_coords_map
-        m = np.abs(cat_map[:, :, 0].astype(float))
-        m[m == 0] = np.nan
-        for i in range(2):
-            if i == 0:
-                bounds = np.arange(-3.5, 6.5, 1)
-                matplotlib.colormaps.unregister("SpectralShrunk")
-                cmap: Union[LinearSegmentedColormap, Colormap] = self.shiftedColorMap(
-                    matplotlib.colormaps["RdBu"], midpoint=0.4, name="SpectralShrunk"
-                )
-            else:
-                bounds = np.arange(-0.5, 6.5, 1)
-                cmap = matplotlib.colormaps["Spectral"]
-            norm = colors.BoundaryNorm(bounds, cmap.N)
-            fig, ax = open_figure(**kwargs)
-            im = ax.imshow(
-                (
-                    (cat_map[:, :, 0] * cat_map[:, :, 1]).T
-                    if i == 0
-                    else (m * cat_map[:, :, 2]).T
-                ),
-                origin="lower",
-                cmap=cmap,
-                norm=norm,
-                extent=(0, self.width, 0, self.height),
-            )
-            cbar = fig.colorbar(
-                im,
-                ax=ax,
-                cmap=cmap,
-                norm=norm,
-                boundaries=bounds,
-                ticks=bounds + 0.5,
-                label="Skyscraper Level" if i == 0 else "Panorama",
-            )
-            if i == 0:
-                ticklabels = cbar.ax.get_ymajorticklabels()
-                newTicklabels = []
-                for ticklabel in ticklabels:
-                    tl = ticklabel
-                    text = tl.get_text().replace("\u2212", "-")
-                    if text[0] == "-":
-                        text = text.replace("-", "Engineer Level ")
-                    elif text == "0":
-                        text = "empty"
-                    else:
-                        text = "Investor Level " + text
-                    tl.set_text(text)
-                    newTicklabels.append(tl)
-                cbar.ax.set_yticklabels(newTicklabels)
-            ax.set_xlim(0, self.width)
-            ax.set_ylim(0, self.height)
-            ax.invert_yaxis()
-            ax.set_title(f"Total inhabitants: {self.total_inhabitants}")
-            for house in self.houses.values():
-                if print_labels:
-                    ax.text(
-                        x=house.x + 1.5,
-                        y=house.y + 1.5,
-                        s=("I" if house.type.value else "E") + str(house.level),
-                        horizontalalignment="center",
-                        verticalalignment="center",
-                    )
-
-                ax.add_patch(
-                    Rectangle(
-                        (house.x, house.y), 3, 3, edgecolor="black", fill=False, lw=1
-                    )
-                )
-            fig.show()
-            if filename is not None:
-                if i == 0:
-                    fname = filename.parent / (filename.stem + "_houses")
-                else:
-                    fname = filename.parent / (filename.stem + "_pan")
-                save_figure(
-                    fig,
-                    filename=fname,
-                    size=(
-                        np.clip(self.width * 2 / 3, 15, 75),
-                        np.clip(self.height * 2 / 3, 15, 75),
-                    ),
-                    formats=["png"],
-                )
+        options: Dict[str, Any] = dict(
+            print_labels=print_labels, filename=filename, dpi=dpi, formats=formats
+        )
+        if background:
+            return render_in_background(self.image(), **options, **kwargs)
+        render_housemap(self.image(), **options, **kwargs)
+        return None
+
+    def image(self) -> HouseMapImage:
+        from anno1800skyscraper.render import HouseMapImage
+
+        layout = self.layout
+        levels = self.levels
+        return HouseMapImage(
+            categorical=self.categorical_coords_map,
+            x=layout.x,
+            y=layout.y,
+            types=layout.types,
+            levels=levels,
+            total=layout.total_inhabitants(levels),
+        )
 
     # Based on https://stackoverflow.com/a/20528097/16509954
     @staticmethod
@@ -218,104 +306,122 @@ class Map:
               Defaults to 1.0 (no upper offset). Should be between
               `midpoint` and 1.0.
         """
-        cdict = {"red": [], "green": [], "blue": [], "alpha": []}  # type: ignore
-
-        # regular index to compute the colors
-        reg_index = np.linspace(start, stop, 257)
-
-        # shifted index to match the data
-        shift_index = np.hstack(
-            [
-                np.linspace(0.0, midpoint, 128, endpoint=False),
-                np.linspace(midpoint, 1.0, 129, endpoint=True),
-            ]
-        )
-
-        for ri, si in zip(reg_index, shift_index):
-            r, g, b, a = cmap(ri)
+        import matplotlib
 
-            cdict["red"].append((si, r, r))
-            cdict["green"].append((si, g, g))
-            cdict["blue"].append((si, b, b))
-            cdict["alpha"].append((si, a, a))
+        from anno1800skyscraper.render import shifted_colormap
 
-        newcmap = matplotlib.colors.LinearSegmentedColormap(name, cdict)  # type: ignore
-        matplotlib.colormaps.register(cmap=newcmap)
+        newcmap = shifted_colormap(cmap, start, midpoint, stop, name)
+        matplotlib.colormaps.register(cmap=newcmap, force=True)
         return newcmap
 
     @property
     def categorical_coords_map(self) -> np.ndarray[Any, np.dtype[Any]]:
-        vals = np.unique(self.coord_map)
+        """
+        Per tile the type (1 investor, -1 engineer, 0 empty), level and
+        panorama of the house covering it.
+        """
+        layout = self.layout
+        levels = self.levels
+        by_house = np.stack(
+            [
+                np.where(layout.types, 1, -1),
+                levels,
+                layout.panoramas(levels),
+            ],
+            axis=1,
+        ).astype(int)
         new_map = np.zeros((self.width, self.height, 3), dtype=int)
-        i = 0
-        for v in vals:
-            if not v:
-                continue
-            house = self.house_by_hash(v.decode())
-            new_map[self.coord_map == v, :] = [
-                1 if house.type.value else -1,
-                house.level,
-                house.panorama,
-            ]
-            i += 1
+        occupied = self.coord_map != EMPTY
+        new_map[occupied] = by_house[self.coord_map[occupied]]
         return new_map
 
+    @property
+    def layout(self) -> Layout:
+        if self._layout is None:
+            self._layout = Layout.from_map(self)
+        return self._layout
+
+    @property
+    def levels(self) -> np.ndarray[Any, np.dtype[np.uint8]]:
+        return np.fromiter(
+            (h.level for h in self.houses.values()),
+            dtype=np.uint8,
+            count=len(self.houses),
+        )
+
     @property
     def total_inhabitants(self) -> int:
-        return sum([h.inhabitants for h in self.houses.values()])
+        return self.layout.total_inhabitants(self.levels)
+
+    @property
+    def upper_bound(self) -> int:
+        """No level assignment of the map has more inhabitants than this."""
+        return upper_bound(self.layout)
 
+    def components(self) -> List[List[House]]:
+        """Groups of houses whose panoramas are independent of each other."""
+        houses = list(self.houses.values())
+        return [[houses[i] for i in rows] for rows in self.layout.components()]
+
+    def symmetries(self) -> Symmetry:
+        """Rotations and reflections of the map that keep houses and their types."""
+        return Symmetry.detect(self.layout)
+
+    @profiling.timed("adjacency")
     def create_adjacencies(self) -> None:
-        for h1, h2 in itertools.product(self.houses.values(), self.houses.values()):
-            h1.adjacency_map.add_adjacency(h2)
+        lookups = 0
+        for h1 in self.houses.values():
+            candidates = self.houses_within(h1.x, h1.y, ADJACENCY_CUTOFF)
+            lookups += len(candidates)
+            for h2 in candidates:
+                h1.adjacency_map.add_adjacency(h2)
+        profiling.PROFILER.count("adjacency_lookups", lookups)
+        self._layout = None
 
     @staticmethod
+    @profiling.timed("load")
     def load_from_ad(filename: Union[str, Path, PosixPath]) -> Map:
         with open(filename, "r") as f:
             data: Dict[Any, Any] = json.load(f)
-            houses = []
-            for obj in data.get("Objects"):  # type: ignore
-                idf = obj.get("Identifier")
-                if not idf in [e.name for e in InvestorSkyscraper] + [
-                    e.name for e in EngineerSkyscraper
-                ]:
-                    continue
-                loc_x, loc_y = [int(i) for i in obj.get("Position").split(",")]
-                type = 0 if int(idf.split("_SkyScraper_")[1][0]) == 4 else 1
-                level = int(idf.split("_SkyScraper_")[1][-1])
-                house = House(x=loc_x, y=loc_y, level=level, house_type=type)
-                houses.append(house)
-            x_offset = -min([h.x for h in houses])
-            y_offset = -min([h.y for h in houses])
-            width = max([h.x for h in houses]) + 3
-            height = max([h.y for h in houses]) + 3
-            map = Map(
-                width=width + x_offset,
-                height=height + y_offset,
-                x_offset=x_offset,
-                y_offset=y_offset,
-            )
-            for house in houses:
-                house.x = house.x + x_offset
-                house.y = house.y + y_offset
-                map.add_house(house)
-            map.create_adjacencies()
-            map.ad_file = filename
-            map.file_contents = data
-            return map
+        skyscrapers = [
+            (SKYSCRAPER_IDENTIFIERS[obj.get("Identifier")], obj.get("Position"))
+            for obj in data.get("Objects")  # type: ignore
+            if obj.get("Identifier") in SKYSCRAPER_IDENTIFIERS
+        ]
+        positions = np.array(
+            ",".join(position for _, position in skyscrapers).split(","),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        x_offset = -int(positions[:, 0].min())
+        y_offset = -int(positions[:, 1].min())
+        map = Map(
+            width=int(positions[:, 0].max()) + 3 + x_offset,
+            height=int(positions[:, 1].max()) + 3 + y_offset,
+            x_offset=x_offset,
+            y_offset=y_offset,
+        )
+        map.add_houses(
+            [
+                House(x=x + x_offset, y=y + y_offset, level=level, house_type=type)
+                for ((type, level), _), (x, y) in zip(skyscrapers, positions.tolist())
+            ]
+        )
+        map.create_adjacencies()
+        map.ad_file = filename
+        map.file_contents = data
+        return map
 
+    @profiling.timed("save")
     def save_to_ad(self, filename: Union[str, Path, PosixPath]) -> None:
         for obj in self.file_contents.get("Objects"):  # type: ignore
-            idf = obj.get("Identifier")
-            if not idf in [e.name for e in InvestorSkyscraper] + [
-                e.name for e in EngineerSkyscraper
-            ]:
+            if obj.get("Identifier") not in SKYSCRAPER_IDENTIFIERS:
                 continue
             loc_x, loc_y = [int(i) for i in obj.get("Position").split(",")]
-            house = self.house_by_coords(loc_x + self.x_offset, loc_y + self.y_offset)
+            house = self.house_at(loc_x + self.x_offset, loc_y + self.y_offset)
             if not house:
                 raise ValueError("House not found")
             obj["Identifier"] = house.annoDesignerIdentifier.name
             obj["Color"] = house.annoDesignerColor
             obj["Radius"] = house.radius
         with open(filename, "w") as file:
-            json.dump(self.file_contents, file)
+            file.write(json.dumps(self.file_contents))
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import multiprocessing
+import queue
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from tqdm import tqdm
+
+from anno1800skyscraper.engine import Layout, IntArray
+from anno1800skyscraper.exact import optimality_gap
+from anno1800skyscraper.progression import MAX_POINTS, Progression
+from anno1800skyscraper.strategies import Strategy, Greedy
+
+if TYPE_CHECKING:
+    from anno1800skyscraper.map import Map
+
+ArraySpec = Dict[str, Tuple[int, Tuple[int, ...], str]]
+
+
+class SharedLayout:
+    """
+    Places the static arrays of a Layout in one shared memory block, so that
+    worker processes can attach to it by name instead of receiving a pickled
+    copy. Use as a context manager in the process that owns the block.
+    """
+
+    def __init__(self, layout: Layout):
+        arrays = layout.static_arrays()
+        self.spec: ArraySpec = {}
+        size = 0
+        for name, array in arrays.items():
+            self.spec[name] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // 8) * 8
+        self.shm = SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            self.view(self.shm, self.spec, name)[...] = array
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @staticmethod
+    def view(shm: SharedMemory, spec: ArraySpec, name: str) -> IntArray:
+        offset, shape, dtype = spec[name]
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def attach(name: str) -> SharedMemory:
+        if sys.version_info >= (3, 13):
+            # Only the owning process may unlink the block
+            return SharedMemory(name=name, track=False)
+        return SharedMemory(name=name)
+
+    def __enter__(self) -> SharedLayout:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+def run_chain(
+    shm_name: str,
+    spec: ArraySpec,
+    levels: IntArray,
+    epochs: int,
+    strategy: Strategy,
+    seed: np.random.SeedSequence,
+    chain: int,
+    reports: Optional[queue.Queue[Tuple[int, int, int]]] = None,
+    report_every: int = 1000,
+    every: int = 1,
+    max_points: Optional[int] = MAX_POINTS,
+    bound: Optional[int] = None,
+    gap_tolerance: Optional[float] = None,
+    stop: Optional[threading.Event] = None,
+) -> Tuple[int, IntArray, Dict[str, Any]]:
+    """
+    Runs one optimization chain on a shared layout, recording its totals in a
+    Progression with every and max_points. The chain stops once the gap of
+    its best total to bound is at most gap_tolerance and then sets stop,
+    which the other chains check every report_every epochs.
+    :return: Best total, best levels and the state of the progression
+    """
+    shm = SharedLayout.attach(shm_name)
+    try:
+        arrays = {name: SharedLayout.view(shm, spec, name) for name in spec}
+        layout = Layout.from_arrays(arrays, levels)
+        rng = np.random.default_rng(seed)
+        strategy.start(layout, epochs)
+        progression = Progression(every, max_points)
+        progression.start(epochs)
+        progression.record(0, layout.total)
+        for epoch in range(1, epochs + 1):
+            strategy.step(rng)
+            progression.record(epoch, strategy.total)
+            done = epoch == epochs
+            if gap_tolerance is not None and bound is not None:
+                if optimality_gap(strategy.best_total, bound) <= gap_tolerance:
+                    done = True
+                    if stop is not None:
+                        stop.set()
+            if epoch % report_every == 0 and stop is not None and stop.is_set():
+                done = True
+            if reports is not None and (epoch % report_every == 0 or done):
+                reports.put((chain, epoch, strategy.best_total))
+            if done:
+                break
+        result = strategy.best_total, strategy.best_levels.copy(), progression.state()
+        del layout, arrays, strategy
+    finally:
+        shm.close()
+    return result
+
+
+def optimize_parallel(
+    house_map: Map,
+    epochs: int,
+    n_change: int,
+    workers: int,
+    seed: Optional[int] = None,
+    batch_size: int = 1,
+    report_every: int = 1000,
+    strategy: Optional[Strategy] = None,
+    progression: Optional[Progression] = None,
+    gap_tolerance: Optional[float] = None,
+) -> Tuple[Map, List[int]]:
+    """
+    Runs one independent chain per worker, every chain starting from the
+    levels of house_map with its own RNG stream spawned from seed. Without a
+    strategy the chains are greedy with n_change and batch_size. The levels
+    of the best chain are written back to house_map and its totals to
+    progression, by default one that keeps up to MAX_POINTS. All chains stop
+    early once one of them is within gap_tolerance of the upper bound.
+    :return: house_map and the recorded totals of the best chain
+    """
+    strategy = Greedy(n_change, batch_size) if strategy is None else strategy
+    if progression is None:
+        progression = Progression(max_points=MAX_POINTS)
+    layout = house_map.layout
+    levels = house_map.levels
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    bound = house_map.upper_bound
+    best_totals = {chain: layout.total_inhabitants(levels) for chain in range(workers)}
+    with (
+        SharedLayout(layout) as shared,
+        multiprocessing.Manager() as manager,
+        ProcessPoolExecutor(max_workers=workers) as executor,
+    ):
+        reports: queue.Queue[Tuple[int, int, int]] = manager.Queue()
+        stop = manager.Event()
+        futures: List[Future[Tuple[int, IntArray, Dict[str, Any]]]] = [
+            executor.submit(
+                run_chain,
+                shared.name,
+                shared.spec,
+                levels,
+                epochs,
+                strategy,
+                seeds[chain],
+                chain,
+                reports,
+                report_every,
+                progression.every,
+                progression.max_points,
+                bound,
+                gap_tolerance,
+                stop,
+            )
+            for chain in range(workers)
+        ]
+        progress = tqdm(total=epochs * workers, unit="epoch")
+        done = {chain: 0 for chain in range(workers)}
+        while not all(future.done() for future in futures) or not reports.empty():
+            try:
+                chain, epoch, total = reports.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            progress.update(epoch - done[chain])
+            done[chain] = epoch
+            best_totals[chain] = total
+            best = max(best_totals.values())
+            gap = optimality_gap(best, bound)
+            progress.set_postfix({"Best": str(best), "Gap": f"{gap:.2%}"})
+        progress.close()
+        results = [future.result() for future in futures]
+    total, best_levels, state = max(results, key=lambda result: result[0])
+    progression.restore(state)
+    layout.reset(best_levels)
+    layout.write_back(house_map)
+    return house_map, progression.tolist()
@@ -0,0 +1,166 @@
+"""
+Instrumentation of the optimizer. The hot paths report to the module level
+PROFILER, which is a NullProfiler that ignores everything unless enable() has
+been called, so the instrumentation can stay in place at close to no cost.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+from pathlib import Path, PosixPath
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+    cast,
+)
+
+Callback = Callable[[str, Dict[str, Any]], None]
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Profiler:
+    """
+    Collects the time spent in named phases, named counters and, with
+    trace_memory, the peak memory traced by tracemalloc. Callbacks are called
+    with the name and data of every event that is emitted.
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.callbacks: List[Callback] = []
+        self.started = time.perf_counter()
+        self.peak_memory: Optional[int] = None
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def phase(self, name: str) -> ContextManager[Any]:
+        return _Phase(self, name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_callback(self, callback: Callback) -> None:
+        self.callbacks.append(callback)
+
+    def emit(self, event: str, **data: Any) -> None:
+        for callback in self.callbacks:
+            callback(event, data)
+
+    def report(self) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "wall_seconds": time.perf_counter() - self.started,
+            "phases": {
+                name: {"calls": self.calls[name], "seconds": seconds}
+                for name, seconds in sorted(
+                    self.seconds.items(), key=lambda item: -item[1]
+                )
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if self.trace_memory:
+            report["peak_memory_mb"] = self.peak() / 2**20
+        return report
+
+    def peak(self) -> int:
+        """Peak traced memory in bytes, frozen once the profiler is disabled."""
+        if self.peak_memory is not None:
+            return self.peak_memory
+        return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+
+    def save(self, filename: Union[str, Path, PosixPath]) -> None:
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+
+class NullProfiler(Profiler):
+    """A profiler that records nothing."""
+
+    enabled = False
+    _phase = contextlib.nullcontext()
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def phase(self, name: str) -> ContextManager[Any]:
+        return self._phase
+
+    def add_time(self, name: str, seconds: float) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def emit(self, event: str, **data: Any) -> None:
+        pass
+
+
+PROFILER: Profiler = NullProfiler()
+
+
+def enable(
+    trace_memory: bool = False, callbacks: Optional[List[Callback]] = None
+) -> Profiler:
+    """Replaces the active profiler with a new, recording one."""
+    global PROFILER
+    PROFILER = Profiler(trace_memory)
+    for callback in callbacks or []:
+        PROFILER.add_callback(callback)
+    return PROFILER
+
+
+def disable() -> Profiler:
+    """Stops recording. :return: The profiler that was active"""
+    global PROFILER
+    profiler = PROFILER
+    if profiler.trace_memory and tracemalloc.is_tracing():
+        profiler.peak_memory = profiler.peak()
+        tracemalloc.stop()
+    PROFILER = NullProfiler()
+    return profiler
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator that records every call of a function as the phase name."""
+
+    def decorator(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with PROFILER.phase(name):
+                return function(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
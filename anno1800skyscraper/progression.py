@@ -0,0 +1,213 @@
+"""
+Recording of the total population over the epochs of a run. Long runs keep a
+downsampled progression in arrays of a fixed size instead of one Python int
+per epoch, so their memory does not grow with the number of epochs.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path, PosixPath
+from typing import Any, Dict, IO, List, Optional, Union
+
+import numpy as np
+
+from anno1800skyscraper.engine import IntArray
+
+# Default number of points kept by Map.optimize and the command line
+MAX_POINTS = 100_000
+
+
+class Progression:
+    """
+    The total after the epochs of a run. Every every-th epoch and every epoch
+    that improves on the best total so far is kept, as well as the last one.
+    With max_points, the arrays are allocated once and whenever they are full,
+    every is doubled and the points that no longer qualify are dropped, at
+    least every second one except for the best. With a filename, the kept
+    points are appended to it as CSV while the run goes on. Use as a context
+    manager or call close() to complete the file.
+    """
+
+    def __init__(
+        self,
+        every: int = 1,
+        max_points: Optional[int] = None,
+        filename: Optional[Union[str, Path, PosixPath]] = None,
+    ):
+        if every < 1:
+            raise ValueError("every has to be at least 1")
+        if max_points is not None and max_points < 4:
+            raise ValueError("max_points has to be at least 4")
+        self.every = every
+        self.max_points = max_points
+        self.size = 0
+        self.epoch = -1
+        self.last = 0
+        self.best: Optional[int] = None
+        self._allocate(1024 if max_points is None else max_points)
+        self.file: Optional[IO[str]] = None
+        if filename is not None:
+            self.file = open(filename, "w")
+            self.file.write("epoch,total\n")
+
+    def _allocate(self, capacity: int) -> None:
+        self._epochs = np.zeros(capacity, dtype=np.int64)
+        self._totals = np.zeros(capacity, dtype=np.int64)
+        self._improved = np.zeros(capacity, dtype=bool)
+
+    def start(self, epochs: int) -> None:
+        """Preallocates room for every epoch of a run of epochs, up to max_points."""
+        capacity = epochs + 1
+        if self.max_points is not None:
+            capacity = min(capacity, self.max_points)
+        if capacity > len(self._epochs):
+            self._grow(capacity)
+
+    def _grow(self, capacity: int) -> None:
+        epochs, totals, improved = self._epochs, self._totals, self._improved
+        self._allocate(capacity)
+        self._epochs[: self.size] = epochs[: self.size]
+        self._totals[: self.size] = totals[: self.size]
+        self._improved[: self.size] = improved[: self.size]
+
+    def _decimate(self) -> None:
+        self.every *= 2
+        n = self.size
+        keep = (self._epochs[:n] % self.every == 0) | self._improved[:n]
+        if keep.sum() > n // 2:
+            # Too many improvements, keep every second point and the best one
+            keep = np.zeros(n, dtype=bool)
+            keep[::2] = True
+            keep[np.flatnonzero(self._improved[:n])[-1]] = True
+        self.size = int(keep.sum())
+        for array in [self._epochs, self._totals, self._improved]:
+            array[: self.size] = array[:n][keep]
+
+    def _store(self, epoch: int, total: int, improved: bool) -> None:
+        if self.size == len(self._epochs):
+            if self.max_points is None:
+                self._grow(2 * self.size)
+            else:
+                self._decimate()
+        self._epochs[self.size] = epoch
+        self._totals[self.size] = total
+        self._improved[self.size] = improved
+        self.size += 1
+        if self.file is not None:
+            self.file.write(f"{epoch},{total}\n")
+
+    def record(self, epoch: int, total: int) -> None:
+        improved = self.best is None or total > self.best
+        if improved:
+            self.best = total
+        self.epoch = epoch
+        self.last = total
+        if improved or epoch % self.every == 0:
+            self._store(epoch, total, improved)
+
+    def _pending(self) -> bool:
+        """Whether the last recorded epoch was not kept."""
+        return self.epoch >= 0 and (
+            self.size == 0 or int(self._epochs[self.size - 1]) != self.epoch
+        )
+
+    @property
+    def epochs(self) -> IntArray:
+        epochs = self._epochs[: self.size]
+        return np.append(epochs, self.epoch) if self._pending() else epochs.copy()
+
+    @property
+    def totals(self) -> IntArray:
+        totals = self._totals[: self.size]
+        return np.append(totals, self.last) if self._pending() else totals.copy()
+
+    def __len__(self) -> int:
+        return self.size + self._pending()
+
+    def tolist(self) -> List[int]:
+        return list(self.totals.tolist())
+
+    def state(self) -> Dict[str, Any]:
+        """The kept points and counters, for checkpoints."""
+        return {
+            "every": self.every,
+            "epoch": int(self.epoch),
+            "last": int(self.last),
+            "best": None if self.best is None else int(self.best),
+            "epochs": self._epochs[: self.size].copy(),
+            "totals": self._totals[: self.size].copy(),
+            "improved": self._improved[: self.size].copy(),
+        }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """
+        Replaces the points with those of state, thinned out to max_points.
+        The restored points are written to the file again.
+        """
+        n = len(state["epochs"])
+        self.every = max(self.every, int(state["every"]))
+        if self.max_points is None or n <= self.max_points:
+            if n > len(self._epochs):
+                self._allocate(n)
+            self.size = n
+            self._epochs[:n] = state["epochs"]
+            self._totals[:n] = state["totals"]
+            self._improved[:n] = state["improved"]
+            if self.file is not None:
+                self.file.writelines(
+                    f"{epoch},{total}\n"
+                    for epoch, total in zip(
+                        state["epochs"].tolist(), state["totals"].tolist()
+                    )
+                )
+        else:
+            self.size = 0
+            for epoch, total, improved in zip(
+                state["epochs"].tolist(),
+                state["totals"].tolist(),
+                state["improved"].tolist(),
+            ):
+                self._store(epoch, total, improved)
+        self.epoch = int(state["epoch"])
+        self.last = int(state["last"])
+        self.best = None if state["best"] is None else int(state["best"])
+
+    @staticmethod
+    def from_state(state: Dict[str, Any]) -> Progression:
+        progression = Progression(int(state["every"]))
+        progression.restore(state)
+        return progression
+
+    def at(self, epochs: IntArray) -> IntArray:
+        """The totals at epochs, taken from the last kept epoch at or before each."""
+        index = np.searchsorted(self.epochs, epochs, side="right") - 1
+        return self.totals[np.maximum(index, 0)]
+
+    def save(self, filename: Union[str, Path, PosixPath]) -> None:
+        """Writes epochs and totals as two columns to a .npy or a .csv file."""
+        points = np.stack([self.epochs, self.totals], axis=1)
+        if Path(filename).suffix == ".npy":
+            np.save(filename, points)
+        else:
+            np.savetxt(
+                filename,
+                points,
+                fmt="%d",
+                delimiter=",",
+                header="epoch,total",
+                comments="",
+            )
+
+    def close(self) -> None:
+        if self.file is None:
+            return
+        if self._pending():
+            self.file.write(f"{self.epoch},{self.last}\n")
+        self.file.close()
+        self.file = None
+
+    def __enter__(self) -> Progression:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
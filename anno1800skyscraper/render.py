@@ -0,0 +1,227 @@
+"""
+Drawing of house maps. The figures are drawn from a HouseMapImage, a few
+plain arrays taken from a Map, so they can be rendered in another process
+while the optimization continues.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from pathlib import Path, PosixPath
+from typing import Any, Optional, Sequence, Union
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib import colors
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import Colormap, LinearSegmentedColormap
+
+from anno1800skyscraper.engine import IntArray
+from utils.figures import open_figure, save_figure
+
+LEVEL_COLORMAP = "SpectralShrunk"
+NON_INTERACTIVE_BACKENDS = {"agg", "cairo", "pdf", "pgf", "ps", "svg", "template"}
+# Corners of a house relative to its position
+HOUSE_CORNERS = np.array([[0, 0], [3, 0], [3, 3], [0, 3]])
+
+
+class HouseMapImage:
+    """
+    What print_housemap draws: the categorical map of Map.categorical_coords_map
+    and position, type and level of every house.
+    """
+
+    def __init__(
+        self,
+        categorical: IntArray,
+        x: IntArray,
+        y: IntArray,
+        types: IntArray,
+        levels: IntArray,
+        total: int,
+    ):
+        self.categorical = categorical
+        self.x = x
+        self.y = y
+        self.types = types
+        self.levels = levels
+        self.total = total
+
+    @property
+    def width(self) -> int:
+        return int(self.categorical.shape[0])
+
+    @property
+    def height(self) -> int:
+        return int(self.categorical.shape[1])
+
+
+def shifted_colormap(
+    cmap: Colormap,
+    start: float = 0,
+    midpoint: float = 0.5,
+    stop: float = 1.0,
+    name: str = "shiftedcmap",
+) -> LinearSegmentedColormap:
+    """Offsets the center of cmap to midpoint, see Map.shiftedColorMap."""
+    cdict = {"red": [], "green": [], "blue": [], "alpha": []}  # type: ignore
+
+    # regular index to compute the colors
+    reg_index = np.linspace(start, stop, 257)
+
+    # shifted index to match the data
+    shift_index = np.hstack(
+        [
+            np.linspace(0.0, midpoint, 128, endpoint=False),
+            np.linspace(midpoint, 1.0, 129, endpoint=True),
+        ]
+    )
+
+    for ri, si in zip(reg_index, shift_index):
+        r, g, b, a = cmap(ri)
+
+        cdict["red"].append((si, r, r))
+        cdict["green"].append((si, g, g))
+        cdict["blue"].append((si, b, b))
+        cdict["alpha"].append((si, a, a))
+
+    return matplotlib.colors.LinearSegmentedColormap(name, cdict)  # type: ignore
+
+
+def level_colormap() -> Colormap:
+    """The colormap of the level figure, registered on first use."""
+    if LEVEL_COLORMAP not in matplotlib.colormaps:
+        matplotlib.colormaps.register(
+            shifted_colormap(
+                matplotlib.colormaps["RdBu"], midpoint=0.4, name=LEVEL_COLORMAP
+            )
+        )
+    return matplotlib.colormaps[LEVEL_COLORMAP]
+
+
+def _level_ticklabel(text: str) -> str:
+    text = text.replace("−", "-")
+    if text[0] == "-":
+        return text.replace("-", "Engineer Level ")
+    if text == "0":
+        return "empty"
+    return "Investor Level " + text
+
+
+def interactive() -> bool:
+    """Whether the matplotlib backend can show figures."""
+    return plt.get_backend().lower() not in NON_INTERACTIVE_BACKENDS
+
+
+def render_housemap(
+    image: HouseMapImage,
+    print_labels: bool = False,
+    filename: Optional[Union[str, Path, PosixPath]] = None,
+    dpi: float = 600,
+    formats: Sequence[str] = ("png",),
+    show: bool = True,
+    **kwargs: Any,
+) -> None:
+    """
+    Draws the level and the panorama figure of a house map and saves them as
+    <filename>_houses and <filename>_pan in every format. The figures are
+    only shown with an interactive backend and closed otherwise.
+    """
+    cat_map = image.categorical
+    occupied = np.abs(cat_map[:, :, 0].astype(float))
+    occupied[occupied == 0] = np.nan
+    corners = (
+        np.stack([image.x, image.y], axis=1)[:, None, :] + HOUSE_CORNERS[None, :, :]
+    )
+    show = show and interactive()
+    for i in range(2):
+        if i == 0:
+            bounds = np.arange(-3.5, 6.5, 1)
+            cmap = level_colormap()
+        else:
+            bounds = np.arange(-0.5, 6.5, 1)
+            cmap = matplotlib.colormaps["Spectral"]
+        norm = colors.BoundaryNorm(bounds, cmap.N)
+        fig, ax = open_figure(**kwargs)
+        im = ax.imshow(
+            (
+                (cat_map[:, :, 0] * cat_map[:, :, 1]).T
+                if i == 0
+                else (occupied * cat_map[:, :, 2]).T
+            ),
+            origin="lower",
+            cmap=cmap,
+            norm=norm,
+            extent=(0, image.width, 0, image.height),
+        )
+        cbar = fig.colorbar(
+            im,
+            ax=ax,
+            cmap=cmap,
+            norm=norm,
+            boundaries=bounds,
+            ticks=bounds + 0.5,
+            label="Skyscraper Level" if i == 0 else "Panorama",
+        )
+        if i == 0:
+            ticklabels = cbar.ax.get_ymajorticklabels()
+            for ticklabel in ticklabels:
+                ticklabel.set_text(_level_ticklabel(ticklabel.get_text()))
+            cbar.ax.set_yticklabels(ticklabels)
+        ax.set_xlim(0, image.width)
+        ax.set_ylim(0, image.height)
+        ax.invert_yaxis()
+        ax.set_title(f"Total inhabitants: {image.total}")
+        if print_labels:
+            for x, y, house_type, level in zip(
+                image.x.tolist(),
+                image.y.tolist(),
+                image.types.tolist(),
+                image.levels.tolist(),
+            ):
+                ax.text(
+                    x=x + 1.5,
+                    y=y + 1.5,
+                    s=("I" if house_type else "E") + str(level),
+                    horizontalalignment="center",
+                    verticalalignment="center",
+                )
+        ax.add_collection(
+            PolyCollection(corners, edgecolors="black", facecolors="none", lw=1)
+        )
+        if show:
+            fig.show()
+        if filename is not None:
+            filename = Path(filename)
+            suffix = "_houses" if i == 0 else "_pan"
+            save_figure(
+                fig,
+                filename=filename.parent / (filename.stem + suffix),
+                size=(
+                    np.clip(image.width * 2 / 3, 15, 75),
+                    np.clip(image.height * 2 / 3, 15, 75),
+                ),
+                dpi=dpi,
+                formats=list(formats),
+            )
+        if not show:
+            plt.close(fig)
+
+
+def _render_in_background(image: HouseMapImage, **kwargs: Any) -> None:
+    plt.switch_backend("agg")
+    render_housemap(image, show=False, **kwargs)
+
+
+def render_in_background(image: HouseMapImage, **kwargs: Any) -> BaseProcess:
+    """
+    Renders the figures of render_housemap in a separate process, without
+    showing them. Join the returned process before relying on the files.
+    """
+    process = multiprocessing.get_context().Process(
+        target=_render_in_background, args=(image,), kwargs=kwargs
+    )
+    process.start()
+    return process
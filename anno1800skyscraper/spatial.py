@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterator, List, Tuple
+
+from anno1800skyscraper.const import ADJACENCY_CUTOFF
+from anno1800skyscraper.house import House
+
+
+class SpatialGrid:
+    """
+    Buckets houses into square cells of cell_size tiles by their lower left
+    corner. A radius query only has to look at the cells overlapping the
+    query's bounding box, so with cell_size equal to the largest radius ever
+    asked for that is the 3x3 block of cells around the query point.
+    """
+
+    def __init__(self, cell_size: float = ADJACENCY_CUTOFF):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[House]] = {}
+
+    def cell(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, house: House) -> None:
+        self.cells.setdefault(self.cell(house.x, house.y), []).append(house)
+
+    def candidates(self, x: float, y: float, radius: float) -> Iterator[House]:
+        x_min, y_min = self.cell(x - radius, y - radius)
+        x_max, y_max = self.cell(x + radius, y + radius)
+        for cx in range(x_min, x_max + 1):
+            for cy in range(y_min, y_max + 1):
+                yield from self.cells.get((cx, cy), [])
+
+    def query(self, x: float, y: float, radius: float) -> List[House]:
+        return [
+            house
+            for house in self.candidates(x, y, radius)
+            if (house.x - x) ** 2 + (house.y - y) ** 2 <= radius**2
+        ]
@@ -0,0 +1,454 @@
+from __future__ import annotations
+
+import copy
+import inspect
+import math
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from anno1800skyscraper.cache import StateCache, ZobristHash
+from anno1800skyscraper.engine import Layout, IntArray
+
+Schedule = Callable[[float, float, float], float]
+
+SCHEDULES: Dict[str, Schedule] = {
+    "exponential": lambda progress, start, end: start * (end / start) ** progress,
+    "linear": lambda progress, start, end: start + (end - start) * progress,
+    "cosine": lambda progress, start, end: end
+    + (start - end) * (1 + math.cos(math.pi * progress)) / 2,
+}
+
+
+class Strategy(ABC):
+    """
+    A search strategy moves the levels of a Layout one epoch at a time. All
+    strategies score moves through Layout.apply/revert and keep track of the
+    best levels they have seen, which may differ from the current ones if the
+    strategy accepts worse moves. accepted tells whether the last epoch kept
+    its move.
+    """
+
+    name = ""
+    n_change = 1
+    cache: Optional[StateCache] = None
+    accepted = True
+
+    def start(self, layout: Layout, epochs: int) -> None:
+        self.layout = layout
+        self.epochs = epochs
+        self.epoch = 0
+        self.best_total = layout.total
+        self.best_levels: IntArray = layout.levels.copy()
+
+    @property
+    def total(self) -> int:
+        return self.layout.total
+
+    def params(self) -> Dict[str, Any]:
+        """The constructor arguments that rebuild the strategy with make_strategy."""
+        accepted = inspect.signature(type(self)).parameters
+        return {name: getattr(self, name) for name in accepted if hasattr(self, name)}
+
+    def state(self) -> Dict[str, IntArray]:
+        """Arrays beyond the levels of the layout that the strategy depends on."""
+        return {}
+
+    def restore(self, state: Dict[str, IntArray]) -> None:
+        """Restores the arrays of state() after start()."""
+
+    def scaled(self, fraction: float) -> Strategy:
+        """A copy of the strategy for a part of the map with n_change scaled down."""
+        strategy = copy.copy(self)
+        strategy.n_change = max(1, round(self.n_change * fraction))
+        return strategy
+
+    def step(self, rng: np.random.Generator) -> None:
+        self._step(rng)
+        self.epoch += 1
+
+    @abstractmethod
+    def _step(self, rng: np.random.Generator) -> None:
+        pass
+
+    def record(self, layout: Layout) -> None:
+        if layout.total > self.best_total:
+            self.best_total = layout.total
+            self.best_levels = layout.levels.copy()
+
+    @staticmethod
+    def metropolis(
+        layout: Layout, rng: np.random.Generator, n_change: int, temperature: float
+    ) -> bool:
+        """
+        Applies a random mutation and keeps it with the Metropolis criterion.
+        At a temperature of 0 only mutations that do not decrease the total
+        are kept, as in Greedy.
+        :return: Whether the mutation was kept
+        """
+        idx, levels = layout.propose(rng, n_change)
+        delta = layout.apply(idx, levels)
+        if delta >= 0 or (
+            temperature > 0 and rng.random() < math.exp(delta / temperature)
+        ):
+            return True
+        layout.revert()
+        return False
+
+
+class Greedy(Strategy):
+    """
+    Keeps a mutation only if it does not decrease the total. With cache_mb,
+    the totals of evaluated level vectors are cached under their Zobrist
+    hash, and a mutation that leads back to a cached state is rejected or
+    picked without scoring it again.
+    """
+
+    name = "greedy"
+
+    def __init__(
+        self, n_change: int, batch_size: int = 1, cache_mb: Optional[float] = None
+    ):
+        self.n_change = n_change
+        self.batch_size = batch_size
+        self.cache_mb = cache_mb
+
+    def start(self, layout: Layout, epochs: int) -> None:
+        super().start(layout, epochs)
+        if self.cache_mb is not None:
+            self.zobrist = ZobristHash(layout.n)
+            self.cache = StateCache(self.cache_mb)
+            self.key = self.zobrist.hash(layout.levels)
+
+    def _step(self, rng: np.random.Generator) -> None:
+        if self.cache is None:
+            self.accepted = self.layout.greedy_step(rng, self.n_change, self.batch_size)
+        elif self.batch_size > 1:
+            self.accepted = self._cached_batch_step(rng, self.cache)
+        else:
+            self.accepted = self._cached_step(rng, self.cache)
+        self.record(self.layout)
+
+    def _cached_step(self, rng: np.random.Generator, cache: StateCache) -> bool:
+        layout = self.layout
+        idx, levels = layout.propose(rng, self.n_change)
+        key = self.zobrist.update(
+            self.key, idx.tolist(), layout.levels[idx].tolist(), levels.tolist()
+        )
+        total = cache.get(key)
+        if total is not None and total < layout.total:
+            return False
+        delta = layout.apply(idx, levels)
+        cache.put(key, layout.total)
+        if delta < 0:
+            layout.revert()
+            return False
+        self.key = key
+        return True
+
+    def _cached_batch_step(self, rng: np.random.Generator, cache: StateCache) -> bool:
+        layout = self.layout
+        candidates = layout.propose_batch(rng, self.batch_size, self.n_change)
+        keys = self.zobrist.batch_hash(candidates).tolist()
+        cached = [cache.get(key) for key in keys]
+        missing = [row for row, total in enumerate(cached) if total is None]
+        totals = np.array([-1 if total is None else total for total in cached])
+        if missing:
+            totals[missing] = layout.batch_total_inhabitants(candidates[missing])
+            for row in missing:
+                cache.put(keys[row], int(totals[row]))
+        best = int(np.argmax(totals))
+        if totals[best] < layout.total:
+            return False
+        changed = np.flatnonzero(candidates[best] != layout.levels)
+        layout.apply(changed, candidates[best, changed])
+        self.key = keys[best]
+        return True
+
+
+class SimulatedAnnealing(Strategy):
+    """
+    Keeps worse mutations with probability exp(delta / T), with the
+    temperature T going from t_start to t_end over the run following one of
+    SCHEDULES. t_end may be 0 to end the run greedily.
+    """
+
+    name = "annealing"
+
+    def __init__(
+        self,
+        n_change: int,
+        t_start: float = 100,
+        t_end: float = 1,
+        schedule: str = "exponential",
+    ):
+        if schedule not in SCHEDULES:
+            raise ValueError(
+                f"Unknown cooling schedule {schedule}, options are {list(SCHEDULES)}"
+            )
+        if t_start <= 0 or t_end < 0:
+            raise ValueError(
+                "The start temperature has to be positive and the end "
+                "temperature at least 0"
+            )
+        self.n_change = n_change
+        self.t_start = t_start
+        self.t_end = t_end
+        self.schedule = schedule
+
+    @property
+    def temperature(self) -> float:
+        progress = self.epoch / max(self.epochs - 1, 1)
+        return SCHEDULES[self.schedule](progress, self.t_start, self.t_end)
+
+    def _step(self, rng: np.random.Generator) -> None:
+        self.accepted = self.metropolis(
+            self.layout, rng, self.n_change, self.temperature
+        )
+        self.record(self.layout)
+
+
+class ParallelTempering(Strategy):
+    """
+    Runs one replica per temperature, geometrically spaced between t_end and
+    t_start, and proposes to exchange the states of neighboring temperatures
+    every swap_every epochs. The replicas share the static arrays of the
+    layout. total refers to the coldest replica.
+    """
+
+    name = "tempering"
+
+    def __init__(
+        self,
+        n_change: int,
+        t_start: float = 100,
+        t_end: float = 1,
+        replicas: int = 8,
+        swap_every: int = 10,
+    ):
+        if replicas < 2:
+            raise ValueError("Parallel tempering needs at least two replicas")
+        if t_start <= 0 or t_end <= 0:
+            raise ValueError("Parallel tempering needs positive temperatures")
+        self.n_change = n_change
+        self.temperatures = np.geomspace(t_end, t_start, replicas)
+        self.swap_every = swap_every
+        self.swaps = 0
+
+    def start(self, layout: Layout, epochs: int) -> None:
+        super().start(layout, epochs)
+        arrays = layout.static_arrays()
+        self.replicas: List[Layout] = [layout] + [
+            Layout.from_arrays(arrays, layout.levels) for _ in self.temperatures[1:]
+        ]
+        self.swaps = 0
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "n_change": self.n_change,
+            "t_start": float(self.temperatures[-1]),
+            "t_end": float(self.temperatures[0]),
+            "replicas": len(self.temperatures),
+            "swap_every": self.swap_every,
+        }
+
+    def state(self) -> Dict[str, IntArray]:
+        return {"replicas": np.stack([replica.levels for replica in self.replicas])}
+
+    def restore(self, state: Dict[str, IntArray]) -> None:
+        for replica, levels in zip(self.replicas, state["replicas"]):
+            replica.reset(levels)
+
+    @property
+    def total(self) -> int:
+        return self.replicas[0].total
+
+    def _step(self, rng: np.random.Generator) -> None:
+        accepted = [
+            self.metropolis(replica, rng, self.n_change, temperature)
+            for replica, temperature in zip(self.replicas, self.temperatures)
+        ]
+        self.accepted = accepted[0]
+        for replica in self.replicas:
+            self.record(replica)
+        if (self.epoch + 1) % self.swap_every:
+            return
+        for i in range(len(self.replicas) - 1):
+            cold, hot = self.replicas[i], self.replicas[i + 1]
+            exponent = (hot.total - cold.total) * (
+                1 / self.temperatures[i] - 1 / self.temperatures[i + 1]
+            )
+            if exponent >= 0 or rng.random() < math.exp(exponent):
+                self.replicas[i], self.replicas[i + 1] = hot, cold
+                self.swaps += 1
+
+
+class LocalSearch(Strategy):
+    """
+    Best improvement local search. A gain table holds the change of the
+    total for incrementing and decrementing every house. Every epoch applies
+    the move with the largest positive gain. The gain of a house depends on
+    the levels of everything within two neighbor relations, so after a move
+    only the gains within two hops of the moved house are recomputed. At a
+    local optimum the search returns to the best levels seen if it is below
+    them and kicks n_change random houses up or down.
+    """
+
+    name = "local"
+
+    def __init__(self, n_change: int):
+        self.n_change = n_change
+        self.kicks = 0
+
+    def start(self, layout: Layout, epochs: int) -> None:
+        super().start(layout, epochs)
+        self.gains = np.full((layout.n, 2), -np.inf)
+        self._update_gains(np.arange(layout.n))
+        self.kicks = 0
+
+    def _update_gains(self, houses: IntArray) -> None:
+        current = self.layout.levels[houses].astype(np.int64)
+        for direction, step in enumerate([1, -1]):
+            levels = current + step
+            valid = (levels >= 1) & (levels <= self.layout.max_levels[houses])
+            self.gains[houses, direction] = -np.inf
+            self.gains[houses[valid], direction] = self.layout.move_gains(
+                houses[valid], levels[valid]
+            )
+
+    def _step(self, rng: np.random.Generator) -> None:
+        i, direction = np.unravel_index(np.argmax(self.gains), self.gains.shape)
+        if self.gains[i, direction] > 0:
+            level = int(self.layout.levels[i]) + (1 if direction == 0 else -1)
+            self.layout.apply(np.array([i]), np.array([level]))
+            self.record(self.layout)
+            self._update_gains(self.layout.within_hops(np.array([i]), 2))
+            return
+        if self.layout.total < self.best_total:
+            self.layout.reset(self.best_levels)
+            self._update_gains(np.arange(self.layout.n))
+        idx, levels = self.layout.propose(rng, self.n_change)
+        self.layout.apply(idx, levels)
+        self.record(self.layout)
+        self.kicks += 1
+        self._update_gains(self.layout.within_hops(idx, 2))
+
+
+class GeneticAlgorithm(Strategy):
+    """
+    Keeps a population of level vectors as one (population, n) uint8 array
+    that is scored in one batched evaluation per epoch. Parents are chosen by
+    tournament selection. A child takes a random disc of houses, with a
+    radius between min_radius and max_radius tiles around a random house,
+    from its second parent and all other levels from the first, followed by
+    the mutation of Layout.propose with n_change houses. The best individual
+    is carried over unchanged. The population starts as copies of the
+    current levels. total refers to the best individual.
+    """
+
+    name = "ga"
+
+    def __init__(
+        self,
+        n_change: int,
+        population: int = 64,
+        tournament: int = 3,
+        min_radius: float = 3,
+        max_radius: float = 12,
+    ):
+        if population < 2:
+            raise ValueError("The population needs at least two individuals")
+        self.n_change = n_change
+        self.population = population
+        self.tournament = tournament
+        self.min_radius = min_radius
+        self.max_radius = max_radius
+
+    def start(self, layout: Layout, epochs: int) -> None:
+        super().start(layout, epochs)
+        self.individuals = np.repeat(layout.levels[None, :], self.population, axis=0)
+        self.fitness = np.full(self.population, layout.total)
+
+    def state(self) -> Dict[str, IntArray]:
+        return {"individuals": self.individuals, "fitness": self.fitness}
+
+    def restore(self, state: Dict[str, IntArray]) -> None:
+        self.individuals = state["individuals"].astype(np.uint8)
+        self.fitness = state["fitness"].astype(np.int64)
+
+    @property
+    def total(self) -> int:
+        return int(self.fitness.max())
+
+    def _select(self, rng: np.random.Generator) -> IntArray:
+        contestants = rng.integers(
+            0, self.population, (self.population, self.tournament)
+        )
+        winners = np.argmax(self.fitness[contestants], axis=1)
+        return contestants[np.arange(self.population), winners]
+
+    def _step(self, rng: np.random.Generator) -> None:
+        layout = self.layout
+        first, second = self._select(rng), self._select(rng)
+        centers = rng.integers(0, layout.n, self.population)
+        radii = rng.uniform(self.min_radius, self.max_radius, self.population)
+        dist_sq = (layout.x[None, :] - layout.x[centers, None]) ** 2 + (
+            layout.y[None, :] - layout.y[centers, None]
+        ) ** 2
+        region = dist_sq <= radii[:, None] ** 2
+        children = np.where(
+            region, self.individuals[second], self.individuals[first]
+        ).astype(np.uint8)
+        layout.mutate_batch(rng, children, self.n_change)
+        elite = int(np.argmax(self.fitness))
+        children[0] = self.individuals[elite]
+        self.individuals = children
+        self.fitness = layout.batch_total_inhabitants(children)
+        best = int(np.argmax(self.fitness))
+        if self.fitness[best] > self.best_total:
+            self.best_total = int(self.fitness[best])
+            self.best_levels = children[best].copy()
+
+
+STRATEGIES: Dict[str, Callable[..., Strategy]] = {
+    Greedy.name: Greedy,
+    SimulatedAnnealing.name: SimulatedAnnealing,
+    ParallelTempering.name: ParallelTempering,
+    LocalSearch.name: LocalSearch,
+    GeneticAlgorithm.name: GeneticAlgorithm,
+}
+
+
+def n_change(change: Union[int, float], houses: int) -> int:
+    """
+    Number of houses to change per mutation, given as a positive integer or
+    as a fraction of the houses between 0 and 1.
+    """
+    if isinstance(change, int) and change > 0:
+        return change
+    if isinstance(change, float) and 0 < change <= 1:
+        return max(int(houses * change), 1)
+    raise ValueError(
+        "Change has to be given as positive integer or float between 0 and 1"
+    )
+
+
+def make_strategy(
+    name: str, n_change: int, batch_size: int = 1, **params: Any
+) -> Strategy:
+    """
+    Builds a strategy by name. params that the strategy does not take and
+    params that are None are ignored, so all command line options can be
+    passed through.
+    """
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {name}, options are {list(STRATEGIES)}")
+    strategy = STRATEGIES[name]
+    accepted = inspect.signature(strategy).parameters
+    kwargs: Dict[str, Any] = {
+        key: value
+        for key, value in dict(params, batch_size=batch_size).items()
+        if key in accepted and value is not None
+    }
+    return strategy(n_change, **kwargs)
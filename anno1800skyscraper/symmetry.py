@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import numpy as np
+
+from anno1800skyscraper.engine import Layout, IntArray
+
+# Rotations and reflections of the plane as (u, v) -> (a*u + b*v, c*u + d*v)
+DIHEDRAL = [
+    (1, 0, 0, 1),
+    (0, -1, 1, 0),
+    (-1, 0, 0, -1),
+    (0, 1, -1, 0),
+    (-1, 0, 0, 1),
+    (1, 0, 0, -1),
+    (0, 1, 1, 0),
+    (0, -1, -1, 0),
+]
+
+
+class Symmetry:
+    """
+    Rotations and reflections that map the set of houses of a layout onto
+    itself while preserving house types, and therefore distances, neighbors
+    and the total of every level assignment. Every symmetry is stored as a
+    permutation perm, the levels x and x[perm] always have the same total.
+    """
+
+    def __init__(self, perms: Sequence[IntArray]):
+        self.perms = np.array(perms, dtype=np.int64).reshape(len(perms), -1)
+
+    @staticmethod
+    def detect(layout: Layout) -> Symmetry:
+        if not layout.n:
+            return Symmetry([np.arange(0)])
+        # Twice the house centers relative to the center of the bounding box,
+        # which keeps all coordinates integer
+        cx = 2 * layout.x + 3
+        cy = 2 * layout.y + 3
+        u = 2 * cx - (cx.min() + cx.max())
+        v = 2 * cy - (cy.min() + cy.max())
+        index = {(a, b): i for i, (a, b) in enumerate(zip(u.tolist(), v.tolist()))}
+        perms: List[IntArray] = []
+        for a, b, c, d in DIHEDRAL:
+            images = [
+                index.get(p)
+                for p in zip((a * u + b * v).tolist(), (c * u + d * v).tolist())
+            ]
+            if any(image is None for image in images):
+                continue
+            perm = np.array(images, dtype=np.int64)
+            if (layout.types[perm] != layout.types).any():
+                continue
+            if (layout.level_counts[perm] != layout.level_counts).any():
+                continue
+            perms.append(perm)
+        return Symmetry(perms)
+
+    def __len__(self) -> int:
+        return len(self.perms)
+
+    def images(self, levels: IntArray) -> IntArray:
+        """All symmetric images of a level vector, one per row."""
+        return levels[..., self.perms]
+
+    def canonical(self, levels: IntArray) -> IntArray:
+        """The lexicographically smallest symmetric image of a level vector."""
+        images = self.images(levels)
+        return images[np.lexsort(images.T[::-1])[0]]
+
+    def canonical_key(self, levels: IntArray) -> bytes:
+        return self.canonical(levels).astype(np.uint8).tobytes()
+
+    def is_canonical(self, levels: IntArray) -> IntArray:
+        """
+        Whether each row of a (k, n) batch is its own canonical form, i.e. not
+        lexicographically larger than any of its images.
+        """
+        levels = np.atleast_2d(levels)
+        keep = np.ones(len(levels), dtype=bool)
+        rows = np.arange(len(levels))
+        for perm in self.perms:
+            differs = levels[:, perm] != levels
+            first = np.argmax(differs, axis=1)
+            larger = levels[rows, first] > levels[rows, perm[first]]
+            keep &= ~(differs.any(axis=1) & larger)
+        return keep
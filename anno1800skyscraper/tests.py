@@ -1,6 +1,39 @@
+import copy
+import itertools
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from anno1800skyscraper import profiling
+from anno1800skyscraper.adaptive import AdaptiveController
+from anno1800skyscraper.batch import find_layouts, optimize_all
+from anno1800skyscraper.cache import ENTRY_BYTES, StateCache, ZobristHash
+from anno1800skyscraper.checkpoint import Checkpoint
+from anno1800skyscraper.cli import main
+from anno1800skyscraper.components import optimize_components, solve_exact
+from anno1800skyscraper.exact import BranchAndBound, optimize_exact
 from anno1800skyscraper.house import House
+from anno1800skyscraper.lns import polish
 from anno1800skyscraper.map import Map
+from anno1800skyscraper.parallel import optimize_parallel
+from anno1800skyscraper.progression import Progression
+from anno1800skyscraper.strategies import (
+    STRATEGIES,
+    SCHEDULES,
+    GeneticAlgorithm,
+    Greedy,
+    LocalSearch,
+    make_strategy,
+)
+from utils.figures import print_progression
+
+LAYOUTS = Path(__file__).parent.parent / "layouts"
 
 
 class TestHouse(unittest.TestCase):
@@ -90,3 +123,531 @@ class TestHouse(unittest.TestCase):
 
         assert house_21.panorama == 2
         assert len(house_21.adjacents) == 7
+
+    def test_standalone_houses(self) -> None:
+        center = House(3, 3, 3, 1)
+        for house in [House(0, 0, 1, 1), House(6, 3, 1, 1)]:
+            center.adjacency_map.add_adjacency(house)
+        assert len(center.adjacent_houses) == 2
+        assert center.panorama == 5
+        house_map = Map(width=10, height=10)
+        house_map.add_house(center)
+        with self.assertRaises(ValueError):
+            Map(width=10, height=10).add_house(center)
+        with self.assertRaises(ValueError):
+            Map(width=10, height=10).add_houses([center])
+        assert house_map.house_at(3, 3) is center
+
+    def test_deepcopy_adjacencies(self) -> None:
+        house_map = Map(width=12, height=12)
+        for x, y in itertools.product(range(0, 12, 3), repeat=2):
+            house_map.add_house(House(x, y, 1 + (x + y) % 5, 1))
+        house_map.create_adjacencies()
+        copied = copy.deepcopy(house_map)
+        copied.create_adjacencies()
+        for house, other in zip(house_map.houses.values(), copied.houses.values()):
+            assert house.adjacents.keys() == other.adjacents.keys()
+            assert len(other.adjacency_map.houses) == len(house.adjacency_map.houses)
+        assert copied.total_inhabitants == house_map.total_inhabitants
+
+
+class TestLayout(unittest.TestCase):
+    def test_matches_house_model(self) -> None:
+        rng = np.random.default_rng(0)
+        for ad_file in sorted(LAYOUTS.glob("*/*.ad")):
+            house_map = Map.load_from_ad(ad_file)
+            layout = house_map.layout
+            houses = list(house_map.houses.values())
+            for _ in range(3):
+                for house in houses:
+                    house.level = int(rng.integers(1, house.max_level + 1))
+                levels = house_map.levels
+                assert list(layout.panoramas(levels)) == [h.panorama for h in houses]
+                assert list(layout.inhabitants(levels)) == [
+                    h.inhabitants for h in houses
+                ]
+                assert house_map.total_inhabitants == sum(h.inhabitants for h in houses)
+
+    def test_apply_revert(self) -> None:
+        rng = np.random.default_rng(1)
+        house_map = Map.load_from_ad(
+            LAYOUTS / "2x2_mixed_mixed" / "2x2_mixed_mixedstart.ad"
+        )
+        layout = house_map.layout
+        start = layout.levels.copy()
+        for _ in range(200):
+            total = layout.total
+            idx, levels = layout.propose(rng, 3)
+            delta = layout.apply(idx, levels)
+            assert layout.total == total + delta == layout.total_inhabitants()
+            if delta < 0:
+                layout.revert()
+                assert layout.total == total == layout.total_inhabitants()
+        assert list(layout.inhab) == list(layout.inhabitants())
+        house_map.optimize(house_map, 50, 2, rng=rng)
+        assert house_map.total_inhabitants >= layout.total_inhabitants(start)
+
+
+class TestSpatialGrid(unittest.TestCase):
+    def test_matches_brute_force(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        houses = list(house_map.houses.values())
+        for house in houses:
+            expected = {
+                other.id
+                for other in houses
+                if other is not house and House.calc_house_distance(house, other) <= 7
+            }
+            assert {h.id for h in house.adjacency_map.adjacents.values()} == expected
+            assert {h.id for h in house_map.houses_within(house.x, house.y, 4.25)} == {
+                other.id
+                for other in houses
+                if House.calc_house_distance(house, other) <= 4.25
+            }
+
+    def test_level_prefixes(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "2x5_IN" / "2x5_IN_out.ad")
+        layout = house_map.layout
+        houses = list(house_map.houses.values())
+        for i, house in enumerate(houses):
+            for level in range(1, house.max_level + 1):
+                expected = {
+                    other.id
+                    for other in house.adjacency_map.adjacents.values()
+                    if House.calc_house_distance(house, other)
+                    <= House.max_dist_by_level(level)
+                }
+                assert {
+                    h.id for h in house.adjacency_map.within_level(level)
+                } == expected
+                assert {houses[j].id for j in layout.neighbors(i, level)} == expected
+
+
+class TestMap(unittest.TestCase):
+    def test_ad_round_trip(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed_out.ad")
+        assert house_map.house_ids == list(range(len(house_map.houses)))
+        assert all(house_map.house_exists(h) for h in house_map.houses.values())
+        with tempfile.TemporaryDirectory() as tmp:
+            house_map.save_to_ad(Path(tmp) / "out.ad")
+            loaded = Map.load_from_ad(Path(tmp) / "out.ad")
+        assert list(loaded.levels) == list(house_map.levels)
+        assert loaded.total_inhabitants == house_map.total_inhabitants
+
+    def test_add_houses(self) -> None:
+        source = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        one_by_one = Map(source.width, source.height)
+        bulk = Map(source.width, source.height)
+        for house in source.houses.values():
+            one_by_one.add_house(House(house.x, house.y, house.level, house.type.value))
+        bulk.add_houses(
+            [House(h.x, h.y, h.level, h.type.value) for h in source.houses.values()]
+        )
+        assert (bulk.coord_map == one_by_one.coord_map).all()
+        assert bulk.positions == one_by_one.positions
+        house = source.house_by_id(5)
+        assert bulk.house_at(house.x, house.y).id == 5  # type: ignore
+        assert bulk.house_at(house.x + 1, house.y) is None
+        with self.assertRaises(ValueError):
+            bulk.add_houses([House(house.x + 1, house.y, 1, 0)])
+        with self.assertRaises(ValueError):
+            Map(10, 10).add_houses([House(0, 0, 1, 0), House(2, 2, 1, 0)])
+
+    def test_render(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        categorical = house_map.categorical_coords_map
+        for house in house_map.houses.values():
+            tile = categorical[house.x + 1, house.y + 1]
+            assert list(tile) == [house.type.value * 2 - 1, house.level, house.panorama]
+        assert (categorical[house_map.coord_map == -1] == 0).all()
+        with tempfile.TemporaryDirectory() as tmp:
+            process = house_map.print_housemap(
+                filename=Path(tmp) / "map", dpi=50, formats=["png"], background=True
+            )
+            assert process is not None
+            process.join()
+            assert process.exitcode == 0
+            assert sorted(f.name for f in Path(tmp).iterdir()) == [
+                "map_houses.png",
+                "map_pan.png",
+            ]
+
+    def test_profiling(self) -> None:
+        events = []
+        profiler = profiling.enable(callbacks=[lambda *event: events.append(event)])
+        try:
+            house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+            Map.optimize(house_map, 50, 1, rng=np.random.default_rng(0))
+        finally:
+            assert profiling.disable() is profiler
+        report = profiler.report()
+        assert {"load", "adjacency", "step", "propose", "evaluate"} <= set(
+            report["phases"]
+        )
+        assert report["phases"]["step"]["calls"] == 50
+        assert report["counters"]["panorama_evaluations"] > 0
+        assert len(events) == 50 and events[-1][0] == "epoch"
+        assert events[-1][1]["epoch"] == 50
+        Map.optimize(house_map, 10, 1)
+        assert profiling.PROFILER.report()["phases"] == {}
+
+    def test_headless(self) -> None:
+        modules = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, anno1800skyscraper.cli; "
+                "print(sorted(set(sys.modules) & {'matplotlib', "
+                "'anno1800skyscraper.batch', 'anno1800skyscraper.checkpoint'}))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert modules.stdout.strip() == "[]"
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy(LAYOUTS / "simple" / "simple.ad", tmp)
+            main(["-d", tmp, "-e", "50", "-c", "1", "-s", "0", "--no-plots"])
+            assert sorted(f.name for f in Path(tmp).iterdir()) == [
+                "simple.ad",
+                "simple_out.ad",
+            ]
+            main(["-d", tmp, "-e", "50", "-c", "1", "--no-plots", "--checkpoint"])
+            assert (Path(tmp) / "simple_checkpoint.npz").exists()
+
+    def test_optimize_all(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["simple", "realistic"]:
+                shutil.copytree(LAYOUTS / name, Path(tmp) / name)
+                for out in (Path(tmp) / name).glob("*_out.ad"):
+                    out.unlink()
+            layouts = find_layouts(tmp)
+            assert [f.stem for f in layouts] == ["realistic_mixed", "simple"]
+            rows = optimize_all(tmp, 100, 1, workers=2, seed=0)
+            assert [row["layout"] for row in rows] == [str(f) for f in layouts]
+            for row, filename in zip(rows, layouts):
+                output = Map.load_from_ad(filename.parent / (filename.stem + "_out.ad"))
+                assert output.total_inhabitants == row["end"] >= row["start"]
+            assert find_layouts(tmp) == layouts
+
+    def test_progression(self) -> None:
+        rng = np.random.default_rng(1)
+        totals = rng.integers(0, 1000, 10000)
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = Path(tmp) / "progression.csv"
+            with Progression(every=2, max_points=64, filename=csv) as progression:
+                for epoch, total in enumerate(totals.tolist()):
+                    progression.record(epoch, total)
+                assert len(progression) <= 65
+                epochs = progression.epochs
+                assert (np.diff(epochs) > 0).all() and epochs[-1] == 9999
+                assert list(progression.totals) == list(totals[epochs])
+                assert totals.max() in progression.totals
+                progression.save(Path(tmp) / "progression.npy")
+            streamed = np.loadtxt(csv, delimiter=",", skiprows=1, dtype=int)
+            assert (streamed[:, 1] == totals[streamed[:, 0]]).all()
+            assert streamed[-1, 0] == 9999 and len(streamed) < 10000
+            saved = np.load(Path(tmp) / "progression.npy")
+            assert (saved == np.stack([epochs, progression.totals], axis=1)).all()
+        fig, ax = print_progression(totals, max_points=100)
+        assert np.asarray(ax.lines[0].get_xdata()).shape == (100,)
+        assert np.asarray(ax.lines[0].get_ydata()).max() == totals.max()
+        plt.close(fig)
+
+    def test_batch(self) -> None:
+        rng = np.random.default_rng(2)
+        house_map = Map.load_from_ad(LAYOUTS / "3x3_IN" / "3x3_IN.ad")
+        layout = house_map.layout
+        candidates = layout.propose_batch(rng, 16, 4)
+        assert candidates.shape == (16, layout.n)
+        assert ((candidates >= 1) & (candidates <= layout.max_levels)).all()
+        assert (np.abs(candidates.astype(int) - layout.levels).sum(axis=1) <= 4).all()
+        assert list(layout.batch_total_inhabitants(candidates)) == [
+            layout.total_inhabitants(c) for c in candidates
+        ]
+        start = layout.total
+        house_map.optimize(house_map, 20, 4, rng=rng, batch_size=8)
+        assert house_map.total_inhabitants == layout.total >= start
+
+    def test_optimize_parallel(self) -> None:
+        results = []
+        for _ in range(2):
+            house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+            house_map, pops = optimize_parallel(house_map, 200, 1, workers=2, seed=3)
+            assert house_map.total_inhabitants == pops[-1] == max(pops)
+            results.append(list(house_map.levels))
+        assert results[0] == results[1]
+        progression = Progression(max_points=16)
+        house_map, pops = optimize_parallel(
+            house_map, 2000, 1, workers=2, seed=3, progression=progression
+        )
+        assert len(pops) <= 17 and progression.epoch == 2000
+        assert house_map.total_inhabitants == max(pops)
+        house_map, pops = optimize_parallel(house_map, 2000, 1, 2, gap_tolerance=1)
+        assert len(pops) == 2
+
+
+class TestStrategies(unittest.TestCase):
+    def test_best_levels_written_back(self) -> None:
+        for name in STRATEGIES:
+            house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+            start = house_map.total_inhabitants
+            strategy = make_strategy(name, 1, replicas=3, population=8)
+            house_map, pops = Map.optimize(
+                house_map, 300, 1, rng=np.random.default_rng(4), strategy=strategy
+            )
+            assert len(pops) == 301
+            assert house_map.total_inhabitants == strategy.best_total >= start
+            assert strategy.best_total >= max(pops)
+
+    def test_zero_temperature(self) -> None:
+        for schedule in SCHEDULES:
+            house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+            strategy = make_strategy("annealing", 2, t_end=0.0, schedule=schedule)
+            house_map, pops = Map.optimize(
+                house_map, 100, 2, rng=np.random.default_rng(1), strategy=strategy
+            )
+            assert pops[-1] >= pops[-2]
+        for name, t_start, t_end in [
+            ("annealing", 0.0, 1.0),
+            ("annealing", 1.0, -1.0),
+            ("tempering", 1.0, 0.0),
+        ]:
+            with self.assertRaises(ValueError):
+                make_strategy(name, 1, t_start=t_start, t_end=t_end)
+
+    def test_state_cache(self) -> None:
+        for batch_size in [1, 8]:
+            results = []
+            for cache_mb in [None, 0.01]:
+                house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+                strategy = Greedy(1, batch_size, cache_mb)
+                house_map, pops = Map.optimize(
+                    house_map, 500, 1, rng=np.random.default_rng(6), strategy=strategy
+                )
+                results.append(pops)
+            assert results[0] == results[1]
+            assert strategy.cache is not None and strategy.cache.hits > 0
+            assert len(strategy.cache) <= strategy.cache.max_entries
+        layout = house_map.layout
+        zobrist = ZobristHash(layout.n)
+        levels = layout.levels.copy()
+        key = zobrist.hash(levels)
+        idx = np.array([0, 3])
+        new = np.array([1, 2])
+        key = zobrist.update(key, idx.tolist(), levels[idx].tolist(), new.tolist())
+        levels[idx] = new
+        assert key == zobrist.hash(levels) == zobrist.batch_hash(levels[None])[0]
+        cache = StateCache(2 * ENTRY_BYTES / 2**20)
+        for key in range(3):
+            cache.put(key, key)
+        assert cache.get(0) is None and cache.get(2) == 2
+        assert cache.hits == cache.misses == 1
+
+    def test_adaptive_controller(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        controller = AdaptiveController(window=50, patience=500)
+        house_map, pops = Map.optimize(
+            house_map, 20000, 20, rng=np.random.default_rng(2), controller=controller
+        )
+        assert len(pops) < 20001
+        assert controller.stale == 500
+        assert controller.strategy.n_change < 20
+        assert controller.acceptance_rate > controller.success_rate
+        assert house_map.total_inhabitants == controller.best_total
+        controller = AdaptiveController(window=10, adapt=False)
+        Map.optimize(house_map, 100, 3, controller=controller)
+        assert controller.strategy.n_change == 3
+
+    def test_checkpoint_resume(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Path(tmp) / "checkpoint.npz"
+            for name in ["greedy", "tempering", "local", "ga"]:
+                strategy = make_strategy(name, 2, replicas=3, population=8)
+                house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+                _, full = Map.optimize(
+                    house_map, 200, 2, np.random.default_rng(9), strategy=strategy
+                )
+                house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+                Map.optimize(
+                    house_map,
+                    100,
+                    2,
+                    np.random.default_rng(9),
+                    strategy=strategy,
+                    checkpoint=checkpoint,
+                )
+                resume = Checkpoint.load(checkpoint)
+                assert resume.epoch == 100
+                house_map = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad")
+                house_map, resumed = Map.optimize(
+                    house_map,
+                    200,
+                    2,
+                    np.random.default_rng(),
+                    strategy=resume.make_strategy(),
+                    resume=resume,
+                )
+                assert resumed == full
+                assert house_map.total_inhabitants == max(full)
+            assert [f.name for f in Path(tmp).iterdir()] == ["checkpoint.npz"]
+
+    def test_local_search_gains(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        layout = house_map.layout
+        strategy = LocalSearch(2)
+        strategy.start(layout, 200)
+        rng = np.random.default_rng(5)
+        for _ in range(200):
+            strategy.step(rng)
+        for i in range(layout.n):
+            for direction, step in enumerate([1, -1]):
+                level = int(layout.levels[i]) + step
+                if not 1 <= level <= layout.max_levels[i]:
+                    assert strategy.gains[i, direction] == -np.inf
+                    continue
+                delta = layout.apply(np.array([i]), np.array([level]))
+                layout.revert()
+                assert strategy.gains[i, direction] == delta
+        assert strategy.best_total == layout.total_inhabitants(strategy.best_levels)
+        layout = Map.load_from_ad(LAYOUTS / "simple" / "simple.ad").layout
+        strategy = LocalSearch(4)
+        strategy.start(layout, 300)
+        rng = np.random.default_rng(8)
+        for _ in range(300):
+            strategy.step(rng)
+            assert strategy.best_total >= layout.total
+
+    def test_genetic_algorithm(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        layout = house_map.layout
+        strategy = GeneticAlgorithm(2, population=16)
+        strategy.start(layout, 20)
+        rng = np.random.default_rng(6)
+        for _ in range(20):
+            strategy.step(rng)
+            assert strategy.individuals.shape == (16, layout.n)
+            assert strategy.individuals.dtype == np.uint8
+            assert list(strategy.fitness) == [
+                layout.total_inhabitants(levels) for levels in strategy.individuals
+            ]
+        assert strategy.best_total == strategy.total >= layout.total
+
+    def test_schedules(self) -> None:
+        for schedule in SCHEDULES.values():
+            assert schedule(0, 100, 1) == 100
+            assert abs(schedule(1, 100, 1) - 1) < 1e-9
+
+
+class TestComponents(unittest.TestCase):
+    def two_stamps(self) -> Map:
+        house_map = Map(width=30, height=6)
+        for x0 in [0, 20]:
+            for x in range(x0, x0 + 6, 3):
+                for y in range(0, 6, 3):
+                    house_map.add_house(House(x, y, 1, int(x0 > 0)))
+        house_map.create_adjacencies()
+        return house_map
+
+    def test_components(self) -> None:
+        house_map = self.two_stamps()
+        components = house_map.components()
+        assert sorted(len(c) for c in components) == [4, 4]
+        for component in components:
+            assert len({h.type for h in component}) == 1
+        layout = house_map.layout
+        for rows in layout.components():
+            assert layout.subset(rows).total == layout.inhab[rows].sum()
+
+    def test_exact(self) -> None:
+        house_map = self.two_stamps()
+        layout = house_map.layout
+        states = np.array(
+            list(itertools.product(*[range(1, m + 1) for m in layout.max_levels]))
+        )
+        best = layout.batch_total_inhabitants(states).max()
+        house_map, pops = optimize_components(house_map, 10, 1, max_states=1000)
+        assert house_map.total_inhabitants == pops[-1] == best
+        assert solve_exact(layout)[0] == best
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        progression = Progression(max_points=16)
+        house_map, pops = optimize_components(
+            house_map, 1000, 1, seed=0, progression=progression
+        )
+        assert len(pops) <= 17 and progression.epochs[-1] == 1000
+        assert (progression.epochs[:-1] % 63 == 0).all()
+        assert house_map.total_inhabitants == pops[-1]
+
+    def test_branch_and_bound(self) -> None:
+        house_map = self.two_stamps()
+        layout = house_map.layout
+        free = np.array([0, 2, 5])
+        candidates = np.repeat(layout.levels[None, :], 3 * 3 * 5, axis=0)
+        candidates[:, free] = list(
+            itertools.product(*[range(1, m + 1) for m in layout.max_levels[free]])
+        )
+        total, levels, optimal = BranchAndBound(layout, free=free).solve()
+        assert optimal
+        assert total == layout.batch_total_inhabitants(candidates).max()
+        assert total == layout.total_inhabitants(levels)
+        best, _ = solve_exact(layout)
+        house_map, optimal = optimize_exact(house_map)
+        assert optimal
+        assert house_map.total_inhabitants == best
+        large = Map(width=120, height=120)
+        for x in range(0, 120, 3):
+            for y in range(0, 120, 3):
+                large.add_house(House(x, y, 1, (x + y) % 2))
+        large.create_adjacencies()
+        start = large.total_inhabitants
+        large, optimal = optimize_exact(large, time_limit=0.5)
+        assert not optimal and large.total_inhabitants >= start
+
+    def test_upper_bound(self) -> None:
+        house_map = self.two_stamps()
+        layout = house_map.layout
+        best, _ = solve_exact(layout)
+        assert best <= house_map.upper_bound
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        layout = house_map.layout
+        levels = np.random.default_rng(8).integers(1, 6, (50, layout.n))
+        levels = np.minimum(levels, layout.max_levels).astype(np.uint8)
+        assert layout.batch_total_inhabitants(levels).max() <= house_map.upper_bound
+        house_map, pops = Map.optimize(house_map, 1000, 1, gap_tolerance=1)
+        assert len(pops) == 2
+        for flags in [["--components", "--gap", "0.1"], ["-w", "2", "--adaptive"]]:
+            with self.assertRaises(SystemExit):
+                main(flags)
+
+    def test_symmetry(self) -> None:
+        house_map = Map(width=12, height=9)
+        for x in range(0, 12, 3):
+            for y in range(0, 9, 3):
+                house_map.add_house(House(x, y, 1, 0))
+        house_map.create_adjacencies()
+        layout = house_map.layout
+        symmetry = house_map.symmetries()
+        assert len(symmetry) == 4
+        levels = np.random.default_rng(3).integers(1, 6, (20, layout.n))
+        levels = np.minimum(levels, layout.max_levels).astype(np.uint8)
+        totals = layout.batch_total_inhabitants(levels)
+        for images in symmetry.images(levels).transpose(1, 0, 2):
+            assert (layout.batch_total_inhabitants(images) == totals).all()
+        canonical = np.array([symmetry.canonical(row) for row in levels])
+        assert symmetry.is_canonical(canonical).all()
+        assert symmetry.canonical_key(levels[0]) == symmetry.canonical_key(
+            symmetry.images(levels[0])[-1]
+        )
+        plain = BranchAndBound(layout)
+        pruned = BranchAndBound(layout, symmetry=symmetry)
+        assert plain.solve()[0] == pruned.solve()[0] == solve_exact(layout)[0]
+        assert pruned.nodes < plain.nodes
+        assert solve_exact(layout, symmetry=symmetry)[0] == plain.best_total
+
+    def test_polish(self) -> None:
+        house_map = Map.load_from_ad(LAYOUTS / "realistic" / "realistic_mixed.ad")
+        start = house_map.total_inhabitants
+        house_map, pops = polish(house_map, 20, rng=np.random.default_rng(7))
+        assert len(pops) == 21
+        assert pops == sorted(pops)
+        assert house_map.total_inhabitants == pops[-1] > start
@@ -0,0 +1,60 @@
+"""
+Measures how building a Map and its adjacencies scales with the number of
+houses. Run with
+
+    python -m benchmarks.adjacency
+
+The brute force column is the former all-pairs create_adjacencies and is
+only run up to --brute-force-limit houses.
+"""
+
+import argparse
+import itertools
+import time
+from typing import List
+
+from anno1800skyscraper.house import House
+from anno1800skyscraper.map import Map
+from benchmarks.layouts import grid_houses
+
+
+def build_map(houses: List[House]) -> Map:
+    house_map = Map(
+        width=max(h.x for h in houses) + 3, height=max(h.y for h in houses) + 3
+    )
+    for house in houses:
+        house_map.add_house(house)
+    return house_map
+
+
+def brute_force_adjacencies(house_map: Map) -> None:
+    for h1, h2 in itertools.product(house_map.houses.values(), repeat=2):
+        h1.adjacency_map.add_adjacency(h2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--sizes", nargs="+", type=int, default=[10, 100, 1000, 10000]
+    )
+    parser.add_argument("--brute-force-limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'houses':>8} {'place [s]':>10} {'grid [s]':>10} {'brute [s]':>10}")
+    for n in args.sizes:
+        start = time.perf_counter()
+        house_map = build_map(grid_houses(n))
+        placed = time.perf_counter()
+        house_map.create_adjacencies()
+        grid = time.perf_counter() - placed
+        brute = "-"
+        if n <= args.brute_force_limit:
+            house_map = build_map(grid_houses(n))
+            start_brute = time.perf_counter()
+            brute_force_adjacencies(house_map)
+            brute = f"{time.perf_counter() - start_brute:10.3f}"
+        print(f"{n:>8} {placed - start:10.3f} {grid:10.3f} {brute:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Synthetic skyscraper layouts for benchmarks. Every generator takes the number
+of houses and a seed and returns houses with random types and levels.
+"""
+
+import json
+import math
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+
+import numpy as np
+
+from anno1800skyscraper.house import House
+
+
+def _random_house(rng: np.random.Generator, x: int, y: int) -> House:
+    house_type = int(rng.integers(0, 2))
+    return House(
+        x=x,
+        y=y,
+        level=int(rng.integers(1, 4 if house_type == 0 else 6)),
+        house_type=house_type,
+    )
+
+
+def grid_houses(n: int, block: int = 3, seed: int = 0) -> List[House]:
+    """
+    n houses on a square grid, with a one tile road after every block houses
+    in both directions.
+    """
+    rng = np.random.default_rng(seed)
+    columns = math.ceil(math.sqrt(n))
+    houses = []
+    for i in range(n):
+        column, row = i % columns, i // columns
+        houses.append(
+            _random_house(rng, 3 * column + column // block, 3 * row + row // block)
+        )
+    return houses
+
+
+def random_houses(n: int, density: float = 0.5, seed: int = 0) -> List[House]:
+    """
+    n houses at random free positions of a square area that they cover to
+    about density.
+    """
+    rng = np.random.default_rng(seed)
+    side = math.ceil(math.sqrt(9 * n / density)) + 3
+    occupied = np.zeros((side, side), dtype=bool)
+    houses: List[House] = []
+    while len(houses) < n:
+        for x, y in rng.integers(0, side - 2, (n, 2)).tolist():
+            if occupied[x : x + 3, y : y + 3].any():
+                continue
+            occupied[x : x + 3, y : y + 3] = True
+            houses.append(_random_house(rng, x, y))
+            if len(houses) == n:
+                break
+    return houses
+
+
+GENERATORS: Dict[str, Callable[[int, int], List[House]]] = {
+    "grid": lambda n, seed: grid_houses(n, block=n, seed=seed),
+    "blocks": lambda n, seed: grid_houses(n, block=3, seed=seed),
+    "random": lambda n, seed: random_houses(n, seed=seed),
+}
+
+
+def save_houses(houses: List[House], filename: Union[str, Path]) -> None:
+    """Writes houses as an Anno Designer file that Map.load_from_ad can read."""
+    objects = [
+        {
+            "Identifier": house.annoDesignerIdentifier.name,
+            "Position": f"{house.x},{house.y}",
+            "Size": "3,3",
+            "Color": house.annoDesignerColor,
+            "Radius": house.radius,
+        }
+        for house in houses
+    ]
+    with open(filename, "w") as f:
+        f.write(json.dumps({"FileVersion": 4, "Objects": objects}))
@@ -0,0 +1,180 @@
+"""
+Measures load time, adjacency build time, evaluation throughput, optimization
+speed and peak memory on the layouts in ./layouts and on synthetic layouts of
+benchmarks.layouts. Run with
+
+    python -m benchmarks.suite -o results.json
+
+and compare a later run against it with --baseline results.json, which lists
+every metric that got worse by more than --tolerance and exits with status 1
+if there is any.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from anno1800skyscraper.house import House
+from anno1800skyscraper.map import Map
+from benchmarks.layouts import GENERATORS, save_houses
+
+LAYOUTS = Path(__file__).parent.parent / "layouts"
+
+# Metric name and whether larger values are better
+METRICS = {
+    "load_s": False,
+    "adjacency_s": False,
+    "layout_s": False,
+    "evals_per_s": True,
+    "batch_evals_per_s": True,
+    "epochs_per_s": True,
+    "peak_mb": False,
+}
+
+
+def _timed(function: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def _rate(function: Callable[[], Any], min_time: float = 0.2) -> float:
+    """Calls of function per second, measured for at least min_time seconds."""
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_time:
+        function()
+        calls += 1
+    return calls / elapsed
+
+
+def measure(filename: Path, epochs: int, batch_size: int) -> Dict[str, Any]:
+    house_map, load = _timed(lambda: Map.load_from_ad(filename))
+    bare = Map(house_map.width - 2, house_map.height - 2)
+    bare.add_houses(
+        [House(h.x, h.y, h.level, h.type.value) for h in house_map.houses.values()]
+    )
+    _, adjacency = _timed(bare.create_adjacencies)
+    layout, layout_time = _timed(lambda: house_map.layout)
+    rng = np.random.default_rng(0)
+    candidates = layout.propose_batch(rng, batch_size, max(1, layout.n // 20))
+    evals = _rate(lambda: layout.total_inhabitants(candidates[0]))
+    batches = _rate(lambda: layout.batch_total_inhabitants(candidates))
+    with contextlib.redirect_stderr(io.StringIO()):
+        _, optimize = _timed(lambda: Map.optimize(house_map, epochs, 1, rng=rng))
+
+    tracemalloc.start()
+    Map.load_from_ad(filename).layout.batch_total_inhabitants(candidates)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "houses": layout.n,
+        "load_s": load,
+        "adjacency_s": adjacency,
+        "layout_s": layout_time,
+        "evals_per_s": evals,
+        "batch_evals_per_s": batches * batch_size,
+        "epochs_per_s": epochs / optimize,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def regressions(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+) -> List[str]:
+    found = []
+    for name, result in results.items():
+        for metric, higher_is_better in METRICS.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = result[metric] / old - 1
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                found.append(
+                    f"{name} {metric}: {old:.4g} -> {result[metric]:.4g} "
+                    f"({change:+.0%})"
+                )
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--sizes", nargs="+", type=int, default=[10, 100, 1000, 5000, 20000]
+    )
+    parser.add_argument(
+        "-g", "--generators", nargs="+", default=list(GENERATORS), choices=GENERATORS
+    )
+    parser.add_argument("-e", "--epochs", type=int, default=2000)
+    parser.add_argument("-b", "--batch", type=int, default=64)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("--no-files", action="store_true")
+    parser.add_argument("-o", "--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print(
+        f"{'layout':<20} {'houses':>7} {'load':>8} {'adj':>8} {'evals/s':>9} "
+        f"{'batch/s':>9} {'epochs/s':>9} {'peak MB':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        files = (
+            []
+            if args.no_files
+            else [
+                (f.stem, f)
+                for f in sorted(LAYOUTS.glob("*/*.ad"))
+                if not f.stem.endswith("_out")
+            ]
+        )
+        for generator in args.generators:
+            for n in args.sizes:
+                filename = Path(tmp) / f"{generator}_{n}.ad"
+                save_houses(GENERATORS[generator](n, args.seed), filename)
+                files.append((filename.stem, filename))
+        for name, filename in files:
+            result = results[name] = measure(filename, args.epochs, args.batch)
+            print(
+                f"{name:<20} {result['houses']:>7} {result['load_s']:8.3f} "
+                f"{result['adjacency_s']:8.3f} {result['evals_per_s']:9.0f} "
+                f"{result['batch_evals_per_s']:9.0f} {result['epochs_per_s']:9.0f} "
+                f"{result['peak_mb']:8.1f}"
+            )
+
+    if args.output is not None:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "epochs": args.epochs,
+            "batch": args.batch,
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"Regression: {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
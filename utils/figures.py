@@ -1,11 +1,12 @@
 import os
 from pathlib import PosixPath, Path
-from typing import List, Tuple, Optional, Union, Dict, Any
+from typing import Tuple, Optional, Union, Any
 
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
+from numpy.typing import ArrayLike
 
 
 def open_figure(
@@ -57,16 +58,36 @@ def save_figure(
 
 
 def print_progression(
-    pops: List[int],
+    pops: ArrayLike,
     filename: Optional[Union[str, Path, PosixPath]] = None,
+    epochs: Optional[ArrayLike] = None,
+    max_points: int = 2000,
     **kwargs: Any,
 ) -> Tuple[Figure, Axes]:
+    """
+    Plots the total population over the epochs
+    :param pops: Total population, after every epoch unless epochs are given
+    :param filename: Filename to save the figure to
+    :param epochs: Epoch of every total
+    :param max_points: Longer progressions are reduced to the maximum of this many
+    bins, with the range of the totals in every bin shaded
+    :param kwargs: Any kwargs passed onto open_figure
+    :return: Figure and axis
+    """
+    totals = np.asarray(pops)
+    x = np.arange(len(totals)) if epochs is None else np.asarray(epochs)
     fig, ax = open_figure(**kwargs)
-    ax.plot(np.arange(0, len(pops)), pops)
+    if len(totals) > max_points:
+        starts = np.linspace(0, len(totals), max_points, endpoint=False).astype(int)
+        lowest = np.minimum.reduceat(totals, starts)
+        totals = np.maximum.reduceat(totals, starts)
+        x = x[starts]
+        ax.fill_between(x, lowest, totals, alpha=0.3, lw=0)
+    ax.plot(x, totals)
     ax.set_xlabel("Epoch")
     ax.set_ylabel("Total Population")
-    ax.set_xlim(0, len(pops) - 1)
-    ax.set_ylim(0, max(pops) * 1.1)
+    ax.set_xlim(x[0], x[-1])
+    ax.set_ylim(0, totals.max() * 1.1)
     ax.grid()
     fig.show()
     if filename is not None: